@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+""" Benchmark for HTMLExtractor, on synthetic ao3 downloads
+Generates html files in the ao3 download format, of different sizes and with different numbers of
+tags, times the extraction and each of its stages, and checks the results against what was
+generated and against the golden file, made with the extractor from before the one-pass parser
+ex: python -m benchmarks.html_extractor --golden benchmarks/golden.json """
+
+from argparse import ArgumentParser
+from json import load as js_load, loads as js_loads, dumps as js_dumps
+from os.path import exists, join
+from random import Random
+from sys import exit
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+from src.html_extractor import HTMLExtractor, parse_work, read_preface
+
+
+# Some of the characters that have to be escaped or that aren't ascii
+words = ["podfic", "café", "naïve", "Ünïcödé", "über", "日本語", "Ελληνικά", "русский", "emoji 🎧",
+    "<3", "Tom & Jerry", "\"quoted\"", "it's", "a > b"]
+ratings = ["General Audiences", "Teen And Up Audiences", "Mature", "Explicit"]
+warnings = ["Creator Chose Not To Use Archive Warnings", "No Archive Warnings Apply",
+    "Major Character Death"]
+categories = ["F/F", "F/M", "Gen", "M/M", "Multi", "Other"]
+fields = ["Parent Works", "Writers", "Summary", "Wordcount", "Language", "Archive Warnings",
+    "Rating", "Categories", "Fandoms", "Relationships", "Characters", "Additional Tags"]
+
+
+def escape(text:str) -> str:
+    """ Escapes the text the way ao3 does """
+    for character, code in [("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"),
+        ("'", "&#39;")]:
+        text = text.replace(character, code)
+    return text
+
+
+def generate_work(seed:int, size:int, n_tags:int, n_authors:int=1, series:bool=False
+    ) -> Tuple[str, Dict[str, Any]]:
+    """ Returns the html of a work of about size characters (at least the preface), and the
+    fields that should be extracted from it
+    The tags are split between relationships, characters and additional tags """
+    random = Random(seed)
+    text = lambda n_words: " ".join(random.choice(words) for _ in range(n_words))
+    work = {
+        "url": f"https://archiveofourown.org/works/{seed}",
+        "title": f"{text(3)} {seed}",
+        "authors": [(f"https://archiveofourown.org/users/a{seed}{i}/pseuds/p{i}", f"{text(1)} {i}")
+            for i in range(n_authors)],
+        "summary": [text(20) for _ in range(random.randint(1, 3))],
+        "wordcount": random.randint(1, 2_000_000),
+        "language": random.choice(["English", "Français", "日本語"]),
+        "series": f"{text(2)} series {seed}" if series else None,
+        "Rating": [random.choice(ratings)],
+        "Archive Warnings": random.sample(warnings, random.randint(1, 2)),
+        "Categories": random.sample(categories, random.randint(1, 2)),
+        "Fandoms": [f"{text(2)} fandom {i}" for i in range(random.randint(1, 3))],
+        "Relationships": [f"{text(1)}/{text(1)} {seed} {i}" for i in range(n_tags // 3)],
+        "Characters": [f"{text(2)} {seed} {i}" for i in range(n_tags // 3)],
+        "Additional Tags": [f"{text(3)} {seed} {i}" for i in range(n_tags - 2 * (n_tags // 3))]}
+
+    def tags(label:str, field:str) -> str:
+        if not work[field]: return ""
+        links = ", ".join(f'<a href="http://archiveofourown.org/tags/{escape(tag)}">' + \
+            f'{escape(tag)}</a>' for tag in work[field])
+        return f"""          <dt>{label}:</dt>
+          <dd>{links}</dd>
+"""
+    byline = ", ".join(f'<a rel="author" href="{escape(url)}">{escape(pseud)}</a>'
+        for url, pseud in work["authors"])
+    series_html = f"""          <dt>Series:</dt>
+          <dd>Part 2 of
+<a href="http://archiveofourown.org/series/{seed}">{escape(work["series"])}</a></dd>
+""" if series else ""
+    summary = "</p>\n<p>".join(escape(paragraph) for paragraph in work["summary"])
+    plural = lambda field, label: label + ("s" if len(work[field]) > 1 else "")
+    preface = f"""<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="UTF-8"/>
+    <title>{escape(work["title"])}</title>
+  </head>
+  <body>
+    <div id="preface">
+      <p class="message">
+        <b>{escape(work["title"])}</b><br/>
+        Posted originally on the <a href="http://archiveofourown.org/">Archive of Our Own</a> at <a href="{work["url"]}">{work["url"]}</a>.
+      </p>
+      <div class="meta">
+        <dl class="tags">
+{tags("Rating", "Rating")}{tags(plural("Archive Warnings", "Archive Warning"), "Archive Warnings")}\
+{tags("Categories" if len(work["Categories"]) > 1 else "Category", "Categories")}\
+{tags(plural("Fandoms", "Fandom"), "Fandoms")}{tags("Relationship", "Relationships")}\
+{tags("Character", "Characters")}{tags("Additional Tags", "Additional Tags")}\
+          <dt>Language:</dt>
+          <dd>{work["language"]}</dd>
+{series_html}          <dt>Stats:</dt>
+          <dd>
+            Published: 2020-01-01
+            Completed: 2020-02-01
+            Words: {work["wordcount"]:,}
+            Chapters: 2/2
+          </dd>
+        </dl>
+        <h1>{escape(work["title"])}</h1>
+        <div class="byline">by {byline}</div>
+        <p>Summary</p>
+        <blockquote class="userstuff"><p>{summary}</p></blockquote>
+      </div>
+    </div>
+    <div id="chapters" class="userstuff">
+"""
+    end = """    </div>
+  </body>
+</html>
+"""
+    paragraph = f"<p>{escape(text(60))}</p>\n"
+    n_paragraphs = max(0, size - len(preface) - len(end)) // len(paragraph)
+    return preface + paragraph * n_paragraphs + end, work
+
+
+def expected_data(works:List[Dict[str, Any]]) -> Dict[str, Any]:
+    """ What extract_html_data should return for the works """
+    dedup = lambda field: list(dict.fromkeys(tag for work in works for tag in work[field]))
+    expected = {
+        "Parent Works": [[work["url"], work["title"]] for work in works],
+        "Writers": list(dict.fromkeys(author for work in works for author in work["authors"])),
+        "Summary": "</p>\n\n<p>".join("</p>\n<p>".join(work["summary"]) for work in works),
+        "Wordcount": sum(work["wordcount"] for work in works),
+        "Language": works[0]["language"],
+        "Rating": works[0]["Rating"][0]}
+    expected.update({field: dedup(field) for field in fields if field not in expected})
+    # Categories under a singular label come first, cf HTMLExtractor.extract_html_data
+    expected["Categories"] = list(dict.fromkeys(
+        [tag for work in works if len(work["Categories"]) == 1 for tag in work["Categories"]]
+        + [tag for work in works if len(work["Categories"]) > 1 for tag in work["Categories"]]))
+    if "Creator Chose Not To Use Archive Warnings" in expected["Archive Warnings"]:
+        expected["Archive Warnings"].remove("Creator Chose Not To Use Archive Warnings")
+        expected["Archive Warnings"].append("Choose Not To Use Archive Warnings")
+    return expected
+
+
+def best_time(function:Callable, repeat:int) -> float:
+    """ Best of repeat runs, in ms """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times) * 1000
+
+
+def time_stages(paths:List[str], repeat:int) -> Dict[str, float]:
+    """ Times each stage of the extraction: reading the prefaces, parsing them, and putting the
+    fields of the works together """
+    prefaces = [read_preface(path) for path in paths]
+    extractor = HTMLExtractor(paths, verbose=False)
+    return {
+        "read": best_time(lambda: [read_preface(path) for path in paths], repeat),
+        "parse": best_time(lambda: [parse_work(preface) for preface in prefaces], repeat),
+        "combine": best_time(extractor.extract_html_data, repeat)}
+
+
+def run_case(folder:str, name:str, seed:int, n_works:int, size:int, n_tags:int, repeat:int,
+    stages:bool) -> Tuple[Dict[str, Any], Dict[str, float], List[str]]:
+    """ Generates the works, extracts them, and returns the extracted data, the timings, and
+    the fields that don't match what was generated """
+    paths, works = [], []
+    for i in range(n_works):
+        html, work = generate_work(seed * 1000 + i, size, n_tags,
+            n_authors=1 + i % 3, series=n_works > 1)
+        paths.append(join(folder, f"{name} {i}.html"))
+        with open(paths[-1], "w") as file:
+            file.write(html)
+        works.append(work)
+    timings = {"extract": best_time(
+        lambda: HTMLExtractor(paths, verbose=False).extract_html_data(), repeat)}
+    data = HTMLExtractor(paths, verbose=False).extract_html_data()
+    if stages: timings.update(time_stages(paths, repeat))
+    expected = expected_data(works)
+    mismatches = [field for field in fields if data[field] != expected[field]]
+    return data, timings, mismatches
+
+
+def get_cases(sizes:List[int], tag_counts:List[int], work_counts:List[int]
+    ) -> List[Tuple[str, int, int, int]]:
+    """ (name, number of works, size, number of tags): one case per size with 50 tags, one
+    per number of tags at 100 KB, one per number of works at 100 KB with 50 tags """
+    cases = [(f"size {size}", 1, size, 50) for size in sizes]
+    cases += [(f"tags {n_tags}", 1, 100_000, n_tags) for n_tags in tag_counts]
+    cases += [(f"works {n_works}", n_works, 100_000, 50) for n_works in work_counts]
+    return cases
+
+
+def parse_size(size:str) -> int:
+    """ "50M" -> 50_000_000 """
+    units = {"K": 1_000, "M": 1_000_000}
+    return int(float(size[:-1]) * units[size[-1].upper()]) if size[-1].upper() in units \
+        else int(size)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="HTMLExtractor benchmark",
+        description="Times the extraction of synthetic ao3 downloads and checks the results")
+    parser.add_argument('--sizes', help="file sizes, ex: 1K 50M", nargs="+",
+        default=["1K", "100K", "1M", "10M", "50M"])
+    parser.add_argument('--tags', help="numbers of tags", nargs="+", type=int,
+        default=[0, 10, 100, 500])
+    parser.add_argument('--works', help="numbers of works extracted together", nargs="+",
+        type=int, default=[1, 10, 30])
+    parser.add_argument('--repeat', help="best of how many runs", type=int, default=5)
+    parser.add_argument('--stages', help="also time reading, parsing and combining the works",
+        action='store_true', required=False)
+    parser.add_argument('--golden', help="json file of the extracted data, created if it " + \
+        "doesn't exist, compared with otherwise", default=None)
+    args = parser.parse_args()
+
+    cases = get_cases([parse_size(size) for size in args.sizes], args.tags, args.works)
+    results, failed = {}, False
+    with TemporaryDirectory() as folder:
+        for seed, (name, n_works, size, n_tags) in enumerate(cases):
+            data, timings, mismatches = run_case(folder, name, seed, n_works, size, n_tags,
+                args.repeat, args.stages)
+            results[name] = data
+            print(f"{name:<14}{timings.pop('extract'):>10.3f} ms", end="")
+            print(f"  mismatches: {', '.join(mismatches)}" if mismatches else "")
+            for stage, timing in timings.items():
+                print(f"    {stage:<18}{timing:>10.3f} ms")
+            failed = failed or bool(mismatches)
+
+    if args.golden:
+        # Tuples become lists in json
+        results = js_loads(js_dumps(results))
+        if exists(args.golden):
+            with open(args.golden, "r") as file:
+                golden = js_load(file)
+            different = [name for name in golden
+                if name in results and golden[name] != results[name]]
+            print(f"Different from {args.golden}: {', '.join(different)}" if different
+                else f"Same as {args.golden}")
+            failed = failed or bool(different)
+        else:
+            with open(args.golden, "w") as file:
+                file.write(js_dumps(results, indent=4, ensure_ascii=False))
+            print(f"Saved {args.golden}")
+    if failed: exit(1)
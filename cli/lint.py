@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+""" Command line program, checks the metadata of all the projects at once """
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from sys import exit
+from typing import Any, Dict, List, Optional, Tuple
+from cli.tracker import get_tracker, yes_no
+from src.project import ProjectsTracker
+from src.project_metadata import lint_metadata, placeholder_text
+
+
+def lint_project(id:str, data:Dict[str, Any], posted:bool) -> Tuple[str, List[str]]:
+    """ Returns the ID and the issues of the project, as text since they're sent back from
+    another process
+    Placeholder values are reported even for projects that aren't posted yet """
+    return id, [str(issue).replace("\n", " ")
+        for issue in lint_metadata(data, posted, placeholders=True)]
+
+
+def load_metadata(tracker:ProjectsTracker, ids:List[str]
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[str]]]:
+    """ Returns the metadata of the projects, from their metadata file, or from the tracker if it
+    can't be found, and the issues found while loading them """
+    metadata, issues = {}, {id: [] for id in ids}
+    for id in ids:
+        try: project = tracker.get_project(id, update_with_local_info=True)
+        except FileNotFoundError as e:
+            issues[id].append(f"Using the tracker info: {str(e).strip()}")
+            project = tracker.get_project(id, update_with_local_info=False)
+        metadata[id] = dict(project.metadata.data)
+    return metadata, issues
+
+
+def is_posted(data:Dict[str, Any]) -> bool:
+    """ Projects with a posting date are checked as posted """
+    posting_date = data.get("Posting Date")
+    return isinstance(posting_date, str) and not placeholder_text(posting_date)
+
+
+def lint(tracker:ProjectsTracker, fandom_abr:Optional[str]=None, posted:Optional[bool]=None,
+    workers:Optional[int]=None, verbose:bool=True) -> Dict[str, List[str]]:
+    """ Returns the issues of each project, checking them in parallel
+    Unless posted is given, projects are checked as posted if they have a posting date """
+    ids = tracker.find_projects(fandom_abr=fandom_abr)
+    if verbose: print(f"Loading {len(ids)} project(s)...", end=" ")
+    metadata, issues = load_metadata(tracker, ids)
+    if verbose: print("Done!")
+    posteds = [is_posted(metadata[id]) if posted is None else posted for id in ids]
+    workers = workers or cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        chunksize = max(1, len(ids) // (4 * workers))
+        for id, project_issues in executor.map(lint_project, ids,
+            [metadata[id] for id in ids], posteds, chunksize=chunksize):
+            issues[id] += project_issues
+    return issues
+
+
+def format_issues(issues:Dict[str, List[str]]) -> str:
+    """ One table for all the projects, one row per issue """
+    width = max([len(id) for id in issues] + [len("ID")]) + 2
+    lines = [f"{'ID':<{width}}Issue"]
+    for id, project_issues in issues.items():
+        for i_issue, issue in enumerate(project_issues):
+            lines.append(f"{id if i_issue == 0 else '':<{width}}{issue}")
+    n_projects = len([id for id, project_issues in issues.items() if project_issues])
+    lines.append(f"{sum(len(project_issues) for project_issues in issues.values())} issue(s) " + \
+        f"in {n_projects} project(s), out of {len(issues)}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="Podfic metadata lint!",
+        description="Lists every issue in the metadata of all the projects")
+    parser.add_argument('--quiet', '-q', help="quiet mode",
+        action='store_true', required=False)
+    parser.add_argument('--tracker', help="path to the tracker file (.json, or .db for SQLite)",
+        default="/home/anna/Music/tracker.json")
+    parser.add_argument('--fandom', help="only check the projects of this fandom", default=None)
+    parser.add_argument('--posted', help="check all the projects as posted (yes) or not (no), " + \
+        "instead of based on their posting date", type=yes_no, default=None)
+    parser.add_argument('--workers', help="number of processes", type=int, default=None)
+    args = parser.parse_args()
+
+    verbose = not args.quiet
+    tracker = get_tracker(args.tracker, verbose)
+    issues = lint(tracker, args.fandom, args.posted, args.workers, verbose)
+    print(format_issues(issues))
+    if any(issues.values()): exit(1)
@@ -3,12 +3,14 @@
 
 from argparse import ArgumentParser
 from traceback import print_exc
-from src.project_metadata import placeholder_text
+from src.project_metadata import ProjectMetadata, placeholder_text
 from src.ao3_drafter import ao3_draft, drafted
 from src.audio_handler import AudioHandler
+from src.content_hashes import ContentHashStore
 from src.gdrive_uploader import GDriveUploader
 from src.ia_uploader import IAUploader, IAUploaderError
 from src.project import Project, ProjectsTracker
+from src.write_behind import WriteBehindFlusher
 from cli.cli_utils import get_existing_id_and_project, get_ia_id
 
 
@@ -26,10 +28,13 @@ def load_ia_project(ia:IAUploader, project:Project, force_ia_id:bool) -> None:
         ia.load_project(project, ia_id, overwrite)
 
 def post(
-        tracker:ProjectsTracker, project:Project, gd:GDriveUploader,
+        tracker:ProjectsTracker, id:str, project:Project, gd:GDriveUploader,
         ia:IAUploader, audio:AudioHandler,
         max_ao3_drafting_attempts:int, downtime:int, force_ia_id, verbose:bool) -> None:
-    
+    """ Posts the project, saving it to the tracker after each upload step
+    Don't call inside of tracker.batch(): if a later step failed, the rollback would drop the
+    record of the uploads that are already done, and they would be done again next time """
+
     # Adding posting date to metadata
     project.metadata.add_posting_date()
 
@@ -81,13 +86,24 @@ if __name__ == "__main__":
         "(like at the start of the mp3 file name)", default=None)
     parser.add_argument('--title', help="title of the work", default=None)
     parser.add_argument('--id', help="id of the project", default=None)
+    parser.add_argument('--write-behind', help="save the tracker and metadata in the background",
+        action='store_true', required=False)
+    parser.add_argument('--skip-unchanged', help="skip tagging and uploading the files that " + \
+        "haven't changed since the last time", action='store_true', required=False)
     args = parser.parse_args()
     verbose = not args.quiet
 
 
-    tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose)
+    flusher = WriteBehindFlusher(verbose=verbose) if args.write_behind else None
+    ProjectMetadata.flusher = flusher
+    if args.skip_unchanged:
+        content_hashes = ContentHashStore(verbose=verbose)
+        AudioHandler.content_hashes = content_hashes
+        IAUploader.content_hashes = content_hashes
+        GDriveUploader.content_hashes = content_hashes
+    tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose,
+        journal=True, lazy=True, flusher=flusher)
     id, project = get_existing_id_and_project(tracker, args.id, args.fandom, args.title, verbose)
-    tracker.update_project(id, project, overwrite=True)
 
     gd = GDriveUploader()
     ia = IAUploader()
@@ -97,6 +113,8 @@ if __name__ == "__main__":
     downtime = 60
 
     print("\Posting", id)
-    post(tracker, project, gd, ia, audio, max_ao3_drafting_attempts, downtime, False, verbose=verbose)
+    tracker.update_project(id, project, overwrite=True)
+    post(tracker, id, project, gd, ia, audio, max_ao3_drafting_attempts, downtime, False,
+        verbose=verbose)
     # Saving tracker info
     tracker.update_project(id, project, overwrite=True)
@@ -39,7 +39,8 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     verbose = not args.quiet
-    tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose)
+    tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose,
+        lazy=True)
     id, project = get_existing_id_and_project(tracker, args.id, args.fandom, args.title, verbose)
     print("\nPromoting", id)
     promo(project)
@@ -4,6 +4,7 @@
 from argparse import ArgumentParser
 from sys import exit
 
+from src.html_extractor import HTMLExtractor, ParentWorkCache
 from src.project import Project, ProjectsTracker
 
 
@@ -35,10 +36,14 @@ if __name__ == "__main__":
         "(like at the start of the mp3 file name)", default=None)
     parser.add_argument('--title', help="title of the work", default=None)
     parser.add_argument('--id', help="id of the project", default=None)
+    parser.add_argument('--no-cache', help="extract the parent works data again, even " + \
+        "if their html files didn't change", action='store_true', required=False)
     args = parser.parse_args()
 
     verbose = not args.quiet
-    tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose)
+    if not args.no_cache: HTMLExtractor.cache = ParentWorkCache(verbose=verbose)
+    tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose,
+        lazy=True)
 
     fandom_abr = args.fandom if args.fandom else input("Fandom abr: ")
     raw_title = args.title if args.title else input("Full project title: ")
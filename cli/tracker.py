@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+""" Command line program for tracker maintenance """
+
+from argparse import ArgumentParser
+from sys import exit
+from typing import List, Optional
+from src.library_scanner import LibraryScanner
+from src.project import ProjectsTracker, ProjectsTrackerSQLite
+from src.tracker_stats import TrackerStats
+from src.tracker_merger import TrackerMerger
+
+
+def get_tracker(tracker_path:str, verbose:bool) -> ProjectsTracker:
+    """ SQLite tracker for .db files, json tracker in journal mode otherwise """
+    if tracker_path.endswith(".db"): return ProjectsTrackerSQLite(tracker_path, verbose=verbose)
+    return ProjectsTracker(tracker_path, verbose=verbose, journal=True, lazy=True)
+
+
+def compact(tracker:ProjectsTracker) -> None:
+    """ Folds the journal back into the tracker file, or reclaims unused space in the database """
+    tracker.compact()
+
+
+def import_json(tracker:ProjectsTracker, json_tracker_path:str) -> None:
+    """ Copies the projects of a json tracker into an SQLite tracker """
+    if not isinstance(tracker, ProjectsTrackerSQLite):
+        raise ValueError(f"Can only import into an SQLite tracker (.db), got {tracker.tracker_path}")
+    tracker.import_tracker(json_tracker_path)
+
+
+def list_projects(tracker:ProjectsTracker, fandom_abr:Optional[str]=None,
+    posting_date:Optional[str]=None, drafted:Optional[bool]=None, ia:Optional[bool]=None,
+    gdrive:Optional[bool]=None) -> None:
+    """ Prints the IDs of the projects matching all the given criteria """
+    ids = tracker.find_projects(fandom_abr, posting_date, drafted, ia, gdrive)
+    for id in ids: print(id)
+    print(f"{len(ids)} project(s)")
+
+
+def stats(tracker:ProjectsTracker, verbose:bool) -> None:
+    """ Prints totals, per fandom, per month and per rating stats, and words per minute """
+    print(TrackerStats(tracker, verbose).report())
+
+
+def merge(output_path:str, tracker_paths:List[str], policy:str, verbose:bool) -> None:
+    """ Merges the tracker files into one, cf TrackerMerger for the policies """
+    TrackerMerger(tracker_paths, policy, verbose).merge(output_path)
+
+
+def scan(tracker:ProjectsTracker, verbose:bool) -> None:
+    """ Updates the library index, prints the project folders that aren't in the tracker yet and
+    the tracker projects without a folder """
+    scanner = LibraryScanner(verbose=verbose)
+    scanner.scan()
+    diff = scanner.diff(tracker.ids())
+    for folder in diff["new"]:
+        print(f"New project {scanner.index[folder]['id']}: {folder}")
+    for folder in diff["unknown"]:
+        print(f"Unknown project: {folder}")
+    for id in diff["missing"]:
+        print(f"No folder for {id}")
+    print(f"{len(diff['new'])} new, {len(diff['unknown'])} unknown, {len(diff['missing'])} " + \
+        "without a folder")
+
+
+def yes_no(choice:str) -> bool:
+    """ argparse type for yes/no options """
+    if choice not in ["yes", "no"]: raise ValueError(f"Expected yes or no, got {choice}")
+    return choice == "yes"
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="Podfic tracker maintenance!")
+    parser.add_argument('--quiet', '-q', help="quiet mode",
+        action='store_true', required=False)
+    parser.add_argument('--tracker', help="path to the tracker file (.json, or .db for SQLite)",
+        default="/home/anna/Music/tracker.json")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser('compact', help="fold the journal back into the tracker file")
+    import_parser = subparsers.add_parser('import',
+        help="copy the projects of a json tracker into an SQLite tracker")
+    import_parser.add_argument('json_tracker', help="path to the json tracker to import")
+    list_parser = subparsers.add_parser('list', help="list the projects matching all the criteria")
+    list_parser.add_argument('--fandom', help="abreviation of the fandom", default=None)
+    list_parser.add_argument('--posting-date', help="posting date, dd-mm-yyyy", default=None)
+    list_parser.add_argument('--drafted', help="yes or no", type=yes_no, default=None)
+    list_parser.add_argument('--ia', help="uploaded to the internet archive, yes or no",
+        type=yes_no, default=None)
+    list_parser.add_argument('--gdrive', help="uploaded to google drive, yes or no",
+        type=yes_no, default=None)
+    subparsers.add_parser('stats', help="print stats over all the projects")
+    subparsers.add_parser('scan',
+        help="index the project folders, and compare them with the tracker")
+    merge_parser = subparsers.add_parser('merge',
+        help="merge several json tracker files into a new one (doesn't use --tracker)")
+    merge_parser.add_argument('output', help="path to the merged tracker file")
+    merge_parser.add_argument('trackers', nargs='+', help="paths to the tracker files to merge")
+    merge_parser.add_argument('--policy', choices=TrackerMerger.policies, default="last",
+        help="which project to keep when several trackers have the same ID: from the first " + \
+        "tracker, the last tracker, or the one with the newest posting date")
+    args = parser.parse_args()
+
+    verbose = not args.quiet
+    if args.command == "merge":
+        merge(args.output, args.trackers, args.policy, verbose)
+        exit()
+
+    tracker = get_tracker(args.tracker, verbose)
+    if args.command == "compact":
+        compact(tracker)
+    elif args.command == "import":
+        import_json(tracker, args.json_tracker)
+    elif args.command == "list":
+        list_projects(tracker, args.fandom, args.posting_date, args.drafted, args.ia, args.gdrive)
+    elif args.command == "stats":
+        stats(tracker, verbose)
+    elif args.command == "scan":
+        scan(tracker, verbose)
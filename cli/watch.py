@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+""" Command line program, watches the project folders and updates the tracker as soon as a new
+mp3 file is exported (Linux only) """
+
+from argparse import ArgumentParser
+from cli.tracker import get_tracker
+from src.file_watcher import FileWatcher
+from src.library_scanner import get_folder_id
+from src.project import ProjectsTracker
+from src.project_files_tracker import FileTracker
+
+
+def update_audio(tracker:ProjectsTracker, folder:str, name:str, change:str) -> None:
+    """ Saves the project's new audio files in the tracker, once they're written """
+    if change not in ["moved in", "written"]: return
+    if not name.endswith(tuple(FileTracker.audio_compressed_exts)): return
+    id = get_folder_id(folder)
+    if id is None or not tracker.id_exists(id):
+        print(f"New audio file {name}, but no project in the tracker for {folder}")
+        return
+    try: project = tracker.get_project(id, update_with_local_info=True)
+    except FileNotFoundError as e:
+        print(f"New audio file {name}, but couldn't load {id}: {e}")
+        return
+    tracker.update_project(id, project)
+    audio = project.files.audio.compressed
+    print(f"New audio file {name} for {id}: {len(audio.unformatted)} wip and " + \
+        f"{len(audio.formatted)} final mp3 file(s)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="Podfic folder watch!",
+        description="Keeps the tracker up to date as mp3 files are exported, until ctrl+c")
+    parser.add_argument('--quiet', '-q', help="quiet mode",
+        action='store_true', required=False)
+    parser.add_argument('--tracker', help="path to the tracker file (.json, or .db for SQLite)",
+        default="/home/anna/Music/tracker.json")
+    parser.add_argument('--folder', help="folder with all the project folders",
+        default=FileTracker.wips_folder)
+    args = parser.parse_args()
+
+    verbose = not args.quiet
+    tracker = get_tracker(args.tracker, verbose)
+    watcher = FileWatcher(args.folder, verbose)
+    watcher.on_change(lambda folder, name, change: update_audio(tracker, folder, name, change))
+    try: watcher.run()
+    except KeyboardInterrupt: pass
+    watcher.close()
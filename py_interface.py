@@ -2,6 +2,7 @@
 """ """
 
 from cli.setup import get_id
+from src.html_extractor import HTMLExtractor, ParentWorkCache
 from src.ia_uploader import IAUploader
 from src.project import Project, ProjectsTracker
 from src.audio_handler import AudioHandler
@@ -22,17 +23,21 @@ from cli.post import post
 
 
 verbose = True
-tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose)
+tracker = ProjectsTracker(tracker_path="/home/anna/Music/tracker.json", verbose=verbose,
+    journal=True, lazy=True)
 
 
 to_setup = [
     # ("", "", ""),
 ]
-for fandom, title, link in to_setup:
-    project = Project(title, fandom, link, download_parent=True, reset_metadata=True, verbose=verbose)
-    id = get_id(project.project_id.get_generic_id(), tracker)
-    tracker.update_project(id, project, overwrite=True)
-    print("Setup", id, "done!")
+if to_setup: HTMLExtractor.cache = ParentWorkCache(verbose=verbose)
+with tracker.batch():
+    for fandom, title, link in to_setup:
+        project = Project(title, fandom, link, download_parent=True, reset_metadata=True,
+            verbose=verbose)
+        id = get_id(project.project_id.get_generic_id(), tracker)
+        tracker.update_project(id, project, overwrite=True)
+        print("Setup", id, "done!")
 
 
 to_post = [
@@ -46,9 +51,10 @@ downtime = 180
 for fandom, title, _ in to_post:
     project = Project(title, fandom, None, download_parent=False, reset_metadata=False, verbose=verbose)
     id = project.project_id.get_generic_id()
+    # Not in a batch, cf post
     tracker.update_project(id, project, overwrite=True)
     post(
-        tracker, project, gd, ia, audio, max_ao3_drafting_attempts,
+        tracker, id, project, gd, ia, audio, max_ao3_drafting_attempts,
         downtime, True, verbose)
     tracker.update_project(id, project, overwrite=True)
 
@@ -10,7 +10,7 @@ from requests import Response, Session
 from typing import Callable, Optional, List, Tuple, Dict
 from src.template_filler import Ao3Template
 from src.base_object import BaseObject, DebugError
-from src.project_metadata import placeholder_link, placeholder_text
+from src.project_metadata import placeholder_link, placeholder_text, drafted_link
 from src.project import Project
 
 
@@ -38,10 +38,8 @@ def ao3_draft(
             sleep(cooldown)
 
 
-works_page = "https://archiveofourown.org/works"
 def drafted(project:Project) -> bool:
-    link = project.metadata.get("Podfic Link")
-    return link != works_page and works_page in link
+    return drafted_link(project.metadata.get("Podfic Link"))
 
 
 class Ao3DrafterError(Exception): pass
@@ -220,11 +218,12 @@ class Ao3Poster(BaseObject):
         self._vprint('Creating ao3 template...', end=" ")
         metadata = self._metadata  # just for convenience, bc it's pretty long...
         metadata.check_and_format(posted=False)
-        # Add podfic tags
-        metadata.add_podfic_tags()
-        # Add Ao3 template html
-        metadata.update_md("Summary", self._template.summary)
-        metadata.update_md("Work Text", self._template.work_text)
+        with metadata.batch():
+            # Add podfic tags
+            metadata.add_podfic_tags()
+            # Add Ao3 template html
+            metadata.update_md("Summary", self._template.summary)
+            metadata.update_md("Work Text", self._template.work_text)
 
         # Format info into a list of tuples using the expected keys
         post_data = []
@@ -5,11 +5,13 @@ from datetime import datetime
 from sys import exit as sys_exit
 from os.path import exists, join, splitext
 from os import rename
+from typing import Optional
 from taglib import File as taglib_File
 from mutagen.mp3 import MP3
 from mutagen.id3 import APIC
 from src.project import Project
 from src.base_object import BaseObject
+from src.content_hashes import ContentHashStore
 from src.project_metadata import placeholder_text
 
 
@@ -24,6 +26,11 @@ def get_padded_track_number_string(track_number, total_tracks):
 class AudioHandler(BaseObject):
     """ Handling audio files: renaming, updating metadata """
 
+    # If set, files that haven't changed since they were last tagged are skipped
+    content_hashes:Optional[ContentHashStore] = None
+    # Steps that rewrite the audio files in place, they still count as done after one another
+    in_place_steps = ["audio tags", "cover art"]
+
     def load_project(self, project:Project) -> None:
         self._project_id = project.project_id
         self._files = project.files
@@ -68,11 +75,19 @@ class AudioHandler(BaseObject):
             else self._files.audio.raw.unformatted
 
         artist = self._get_artist_tag()
+        hashes = AudioHandler.content_hashes
 
         for file_paths in [mp3s, wavs]:
             n_tracks = len(file_paths)
+            # Everything the tags depend on, besides the file
+            inputs = "\n".join(
+                [self._metadata_title, artist, str(datetime.now().year)] + file_paths)
+            todo = hashes.changed_since("audio tags", file_paths, inputs) if hashes else file_paths
             for track_number, file_path in enumerate(file_paths):
                 track_number += 1
+                if file_path not in todo:
+                    self._vprint(f"{file_path} (unchanged, skipping)")
+                    continue
                 self._vprint(file_path)
                 audio = taglib_File(file_path)
                 audio.tags["TITLE"] = [self._metadata_title]
@@ -86,6 +101,7 @@ class AudioHandler(BaseObject):
                 audio.tags["GENRE"] = ["Podfic"]
                 audio.tags["DATE"] = [str(datetime.now().year)]
                 audio.save()
+            if hashes: hashes.mark_done("audio tags", todo, inputs, AudioHandler.in_place_steps)
 
         self._vprint("Done!\n")
 
@@ -122,9 +138,13 @@ class AudioHandler(BaseObject):
             with open(self._files.cover.compressed[0], 'rb') as file:
                 data = file.read()
 
-            for file_path in self._files.audio.compressed.formatted \
-                + self._files.audio.compressed.unformatted:
-
+            file_paths = self._files.audio.compressed.formatted \
+                + self._files.audio.compressed.unformatted
+            hashes = AudioHandler.content_hashes
+            if hashes:
+                inputs = hashes.hash(self._files.cover.compressed[0])
+                file_paths = hashes.changed_since("cover art", file_paths, inputs)
+            for file_path in file_paths:
                 audio = MP3(file_path)
                 if audio.tags is None:  # https://github.com/quodlibet/mutagen/issues/327
                     audio.add_tags()
@@ -137,6 +157,8 @@ class AudioHandler(BaseObject):
                         data = data
                 ))
                 audio.save()
+            if hashes:
+                hashes.mark_done("cover art", file_paths, inputs, AudioHandler.in_place_steps)
             self._vprint("Done!\n")
 
 
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+""" Content hashes of the project files, to know which files changed since a step was last done
+on them (tagging, uploading...) and skip the others """
+
+from hashlib import blake2b
+from json import load as js_load, dumps as js_dumps
+from mmap import mmap, ACCESS_READ
+from os import stat
+from os.path import exists, join
+from time import time_ns
+from typing import Any, Dict, Iterable, List, Optional
+from src.base_object import BaseObject
+from src.project_files_tracker import FileTracker, racy_delay
+from src.write_behind import atomic_write
+
+
+class ContentHashStore(BaseObject):
+    """ Hashes of the files, and of the files as they were when each step was last done on them
+
+    Files are only hashed again if their size or modification time changed. Use changed_since
+    before a step to get the files it still needs to be done on, and mark_done after it. inputs
+    is anything else the step depends on, ex: the cover file's hash for adding the cover art, if
+    it changes the step has to be done again on all the files.
+    When a step modifies the files (ex: adding tags), the steps passed as carry_over that were
+    done on the previous version of the files are kept as done, ex: the other steps that rewrite
+    the files in place. The others (ex: uploads) have to be done again. """
+
+    chunk_size = 1 << 20
+    # Files bigger than that (bytes) are memory-mapped for hashing, ex: wav files
+    mmap_threshold = 64 << 20
+
+    def __init__(self, store_path:Optional[str]=None, verbose:bool=True) -> None:
+        super().__init__(verbose)
+        self.store_path = store_path if store_path \
+            else join(FileTracker.wips_folder, "hashes.json")
+        # path -> {size, mtime, hash, hashed (time)}
+        self._files:Dict[str, Dict[str, Any]] = {}
+        # step -> path -> [hash, inputs]
+        self._steps:Dict[str, Dict[str, List[str]]] = {}
+        if exists(self.store_path):
+            with open(self.store_path, "r") as file:
+                saved = js_load(file)
+            self._files, self._steps = saved["files"], saved["steps"]
+
+    @staticmethod
+    def _hash_file(path:str, size:int) -> str:
+        """ Hashes the file chunk by chunk """
+        hasher = blake2b(digest_size=20)
+        with open(path, "rb") as file:
+            if size >= ContentHashStore.mmap_threshold:
+                with mmap(file.fileno(), 0, access=ACCESS_READ) as mapped:
+                    with memoryview(mapped) as view:
+                        for start in range(0, len(view), ContentHashStore.chunk_size):
+                            hasher.update(view[start:start+ContentHashStore.chunk_size])
+            else:
+                for chunk in iter(lambda: file.read(ContentHashStore.chunk_size), b""):
+                    hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def hash(self, path:str) -> str:
+        """ Returns the hash of the file, only hashing it again if it changed
+        Files modified right before they were hashed are hashed again, the modification time
+        isn't precise enough to tell apart changes made right after """
+        stats = stat(path)
+        known = self._files.get(path)
+        if known and known["size"] == stats.st_size and known["mtime"] == stats.st_mtime_ns \
+            and known["hashed"] - known["mtime"] > racy_delay:
+            return known["hash"]
+        hashed = time_ns()
+        content_hash = ContentHashStore._hash_file(path, stats.st_size)
+        self._files[path] = {"size": stats.st_size, "mtime": stats.st_mtime_ns,
+            "hash": content_hash, "hashed": hashed}
+        return content_hash
+
+    def changed_since(self, step:str, paths:Iterable[str], inputs:str="") -> List[str]:
+        """ Returns the files that changed since the step was last done on them, or that it was
+        never done on, or that it was done on with other inputs """
+        done = self._steps.get(step, {})
+        return [path for path in paths if done.get(path) != [self.hash(path), inputs]]
+
+    def mark_done(self, step:str, paths:Iterable[str], inputs:str="",
+        carry_over:Iterable[str]=()) -> None:
+        """ Saves that the step was done on the files, as they are now
+        carry_over: the steps that still count as done if this one modified the files """
+        for path in paths:
+            previous = self._files.get(path, {}).get("hash")
+            content_hash = self.hash(path)
+            if previous and previous != content_hash:
+                # The step modified the file, the carried over steps done on the previous version
+                # still are
+                for done in [self._steps.get(other, {}) for other in carry_over]:
+                    if path in done and done[path][0] == previous: done[path][0] = content_hash
+            self._steps.setdefault(step, {})[path] = [content_hash, inputs]
+        self.save()
+
+    def save(self) -> None:
+        """ Saves the hashes to the store file """
+        atomic_write(self.store_path, js_dumps({"files": self._files, "steps": self._steps}))
@@ -1,16 +1,41 @@
 # -*- coding: utf-8 -*-
 """ Fandom taxonomy stuff! WIP """
 
+from argparse import ArgumentParser
+from atexit import register as atexit_register
+from csv import reader as csv_reader, writer as csv_writer
+from io import StringIO
 from sqlite3 import connect as sqlite3_connect
-from pandas import DataFrame, read_csv, concat
+from os import stat
 from os.path import exists, join, dirname
+from src.write_behind import atomic_write
 
 
 class FandomTaxonomy:
     """ Fandom taxonomy: from parent work fandom tags, preferred podficcer fandom tags,
     abbreviation and fandom categories.
     The abbreviation isn't actually used in the podfic posting helper (we need it to find the
-    folder, before we get to the info). """
+    folder, before we get to the info).
+
+    Use shared to get the instance shared by the whole process instead of loading the taxonomy
+    again for each project. """
+
+    @classmethod
+    def shared(cls):
+        """ Returns the taxonomy shared by the whole process, loaded on first use and reloaded if
+        it changed since """
+        if cls.__dict__.get("_shared") is None:
+            cls._shared = cls()
+            cls._shared._share()
+        else:
+            cls._shared._refresh()
+        return cls._shared
+
+    def _share(self):
+        """ Called once on the shared instance, ex: to write changes at exit """
+
+    def _refresh(self):
+        """ Reloads the taxonomy if it was changed by something else since it was loaded """
 
     @staticmethod
     def _get_canonical_key(tags):
@@ -42,6 +67,40 @@ class FandomTaxonomy:
         - ["Women's Hockey RPF"] -> ["Hockey RPF", "Women's Hockey RPF"] """
         raise NotImplementedError()
 
+    @staticmethod
+    def _pick_option(to_pick, based_on, options=[]):
+        """ Offers the user all given options and to add a new one. Returns their choice. """
+
+        # print options
+        print(f"\nWhich {to_pick} for {based_on}? You can:",
+            "\n- Pick a number",
+            "\n- Hit return for the first item in the list (if any)",
+            "\n- Or type the new value directly (separated with ', ' if it's a list)")
+        for i, option in enumerate(options):
+            print(f"{i}) {option}")
+
+        # get user's choice
+        choice = input("Your choice? ")
+        # hit return, but no list to pick from
+        if not choice and not options:
+            print("We're going to need a value...")
+            return FandomTaxonomy._pick_option(to_pick, based_on, options)
+        # hit return, picking first option in the list
+        elif not choice:
+            n_option = 0
+        else:
+            # input a number from the list
+            try:
+                n_option = int(choice)
+                if n_option < 0 or n_option >= len(options):
+                    print("Invalid choice")
+                    return FandomTaxonomy._pick_option(to_pick, based_on, options)
+            # anything else will be interpreted as a new value
+            except ValueError:
+                return choice
+
+        return options[n_option]
+
 
 class FandomTaxonomySQLite(FandomTaxonomy):
     """ Fandom taxonomy: from parent work fandom tags, preferred podficcer fandom tags,
@@ -49,114 +108,84 @@ class FandomTaxonomySQLite(FandomTaxonomy):
     The abbreviation isn't actually used in the podfic posting helper (we need it to find the
     folder, before we get to the info).
 
-    SQLite implementation. NOTE works, but would need some adaptations:
-    - better input handling when asked to pick a number, cf CSV implementation
-    - many-to-many with rel tables for everything? many-to-one for each, but list blobs? etc
-
-    TODO get rid of the f strings and make it safe against injections """
-
-    db_path = "fandom_taxonomy.db"
-
-    def __init__(self, db_path=db_path):
-        self._connection = sqlite3_connect(db_path)
-        self._cursor = self._connection.cursor()
-        requests = [
-            """CREATE TABLE IF NOT EXISTS AbrToCategory (
-            abr TEXT NOT NULL,
-            category TEXT NOT NULL,
-            PRIMARY KEY (abr)
-            );""",
-            """CREATE TABLE IF NOT EXISTS MainToAbr (
-            main_tag TEXT NOT NULL,
-            abr TEXT NOT NULL,
-            PRIMARY KEY (main_tag)
-            FOREIGN KEY (abr) REFERENCES AbrToCategory (abr)
-            );""",
-            """CREATE TABLE IF NOT EXISTS PreferredToMain (
-            preferred_tags TEXT NOT NULL,
-            main_tag TEXT NOT NULL,
-            PRIMARY KEY (preferred_tags)
-            FOREIGN KEY (main_tag) REFERENCES MainToAbr (main_tag)
-            );""",
-            """CREATE TABLE IF NOT EXISTS OriginalToPreferred (
-            original_tags TEXT NOT NULL,
-            preferred_tags TEXT NOT NULL,
-            PRIMARY KEY (original_tags),
-            FOREIGN KEY (preferred_tags) REFERENCES PreferredToMain(preferred_tags)
-            );"""
-        ]
-        self._execute(requests)
-
-    def _execute(self, requests):
-        """ Executes and commits the requests to the db """
-        for request in requests:
-            request = request.replace("'", "''")
-            try:
-                self._cursor.execute(request)
-                self._connection.commit()
-            except Exception as exception:
-                print(request)
-                raise exception
-
-    def _fetch(self, request):
-        """ Fetches the  results of the request from the db """
-        request = request.replace("'", "''")
-        try:
-            self._cursor.execute(request)
-        except Exception as exception:
-            print(request)
-            raise exception
-        return self._cursor.fetchall()
-
-    def _get_info(self, table_name, primary_key_name, primary_key_value, target_key_name,
-        options=[]):
-        """ Returns target_key_name values in table_name where primary_key_name is
-        primary_key_value.
-        If info missing, asks for it with no hinting, then offers to save it. """
-
-        # Looking into the database...
-        request = f'SELECT {target_key_name} FROM {table_name} ' + \
-            f'WHERE {primary_key_name} = "{primary_key_value}"'
-        res = self._fetch(request)
-
-        # If we find a match, awesome!
-        if res:
-            result = res[0][0]
-            return result
-
-        # Else, we ask for the value
-        print(f"Wait! {target_key_name} unknown for {primary_key_value}.")
-
-        # Can be straightforward, just input
-        if not options:
-            should_be = input("Value, separated with ', ' if list: ")
-
-        # Or offer potential options
-        else:
-            print("Please choose one of the following:")
-            for i, option in enumerate(options):
-                print(i, option)
-            print(len(options), "(new)")
-            n_option = int(input("Your choice? "))  # TODO will fail if it's not a number, cf CSV
-            if n_option >= len(options):
-                should_be = input("New: ")
-            else:
-                should_be = options[n_option]
-
-        # Offer to save new value
-        print("We can save these preferences for next time!")
-        print("- No (hit return without typing anything)")
-        print("- Yes (type anything then hit return)")
-        if input("Your choice? ") != "":
-            requests = [
-                f"""INSERT OR IGNORE INTO {table_name} ({primary_key_name}, {target_key_name})
-                VALUES("{primary_key_value}", "{should_be}")"""
-            ]
-            self._execute(requests)
-
-        # In any case, we return the given value
-        return should_be
-
+    SQLite implementation. One table per column transition, each value leads to one single value
+    (many-to-one), unlike the CSV implementation where a value can have several options.
+    What's picked is saved at the end of get_all_info, in one transaction.
+    cf csv_to_sqlite and sqlite_to_csv to go from one implementation to the other """
+
+    db_path = join(dirname(__file__), "fandom_taxonomy.db")
+    # table -> (key column, value column), in lookup order
+    # Identifiers can't be query parameters, only these are put in the queries
+    tables = {
+        "OriginalToPreferred": ("original_tags", "preferred_tags"),
+        "PreferredToMain": ("preferred_tags", "main_tag"),
+        "MainToAbr": ("main_tag", "abr"),
+        "AbrToCategory": ("abr", "category")}
+    # WITHOUT ROWID: the rows are stored in the primary key index, so a lookup is one search
+    schema = [
+        """CREATE TABLE IF NOT EXISTS AbrToCategory (
+        abr TEXT NOT NULL,
+        category TEXT NOT NULL,
+        PRIMARY KEY (abr)
+        ) WITHOUT ROWID;""",
+        """CREATE TABLE IF NOT EXISTS MainToAbr (
+        main_tag TEXT NOT NULL,
+        abr TEXT NOT NULL,
+        PRIMARY KEY (main_tag),
+        FOREIGN KEY (abr) REFERENCES AbrToCategory (abr)
+        ) WITHOUT ROWID;""",
+        """CREATE TABLE IF NOT EXISTS PreferredToMain (
+        preferred_tags TEXT NOT NULL,
+        main_tag TEXT NOT NULL,
+        PRIMARY KEY (preferred_tags),
+        FOREIGN KEY (main_tag) REFERENCES MainToAbr (main_tag)
+        ) WITHOUT ROWID;""",
+        """CREATE TABLE IF NOT EXISTS OriginalToPreferred (
+        original_tags TEXT NOT NULL,
+        preferred_tags TEXT NOT NULL,
+        PRIMARY KEY (original_tags),
+        FOREIGN KEY (preferred_tags) REFERENCES PreferredToMain (preferred_tags)
+        ) WITHOUT ROWID;""",
+        # Covering index for the category options
+        "CREATE INDEX IF NOT EXISTS AbrToCategoryCategory ON AbrToCategory (category);"]
+
+    def __init__(self, db_path=None):
+        self._connection = sqlite3_connect(db_path if db_path else FandomTaxonomySQLite.db_path)
+        # Readers don't block the writer and the other way around, ex: two setups at once
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            for request in FandomTaxonomySQLite.schema:
+                self._connection.execute(request)
+
+    def _share(self):
+        """ The shared instance is closed at exit """
+        atexit_register(self.close)
+
+    def _get_value(self, table_name, key):
+        """ Returns the value for the key in the table, None if unknown """
+        key_column, value_column = FandomTaxonomySQLite.tables[table_name]
+        row = self._connection.execute(
+            f"SELECT {value_column} FROM {table_name} WHERE {key_column} = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _get_info(self, table_name, key, to_save, options=[]):
+        """ Returns the value for the key in the table.
+        If unknown, asks for it, and adds it to to_save """
+        value = self._get_value(table_name, key)
+        if value is None:
+            value = FandomTaxonomy._pick_option(FandomTaxonomySQLite.tables[table_name][1], key,
+                options)
+            to_save.append((table_name, key, value))
+        return value
+
+    def _save(self, rows):
+        """ Saves the (table, key, value) rows, in one transaction
+        Keys that are already known keep their value """
+        with self._connection:
+            for table_name, key, value in rows:
+                key_column, value_column = FandomTaxonomySQLite.tables[table_name]
+                self._connection.execute(f"INSERT OR IGNORE INTO {table_name} " + \
+                    f"({key_column}, {value_column}) VALUES (?, ?)", (key, value))
 
     def get_all_info(self, original_tags):
         """ Gets the preferred fandom tags, the main tracker tag and the fandom cateory from
@@ -166,40 +195,29 @@ class FandomTaxonomySQLite(FandomTaxonomy):
         Takes a list of canonical tags, treats it as one single tag.
         This allows for one-to-many, many-to-one and many-to-many cases such as:
         - ["Batman (Comics)", "Batman - All Media Types"] -> ["Batman (Comics)"]
-        - ["Women's Hockey RPF"] -> ["Hockey RPF", "Women's Hockey RPF"] """
+        - ["Women's Hockey RPF"] -> ["Hockey RPF", "Women's Hockey RPF"]
 
+        Returns lists, like the CSV implementation """
+        to_save = []
         original_key = FandomTaxonomy._get_canonical_key(original_tags)
+        preferred_key = self._get_info("OriginalToPreferred", original_key, to_save)
+        main_tag = self._get_info("PreferredToMain", preferred_key, to_save)
+        abr = self._get_info("MainToAbr", main_tag, to_save)
+        categories = [category for category, in self._connection.execute(
+            "SELECT DISTINCT category FROM AbrToCategory ORDER BY category")]
+        category = self._get_info("AbrToCategory", abr, to_save, categories)
+
+        if to_save:
+            print("You chose:")
+            print(*[f"\n{FandomTaxonomySQLite.tables[table_name][1]} for {key} -> {value}"
+                for table_name, key, value in to_save])
+            print("We can save these preferences for next time!")
+            print("- No (hit return without typing anything)")
+            print("- Yes (type anything then hit return)")
+            if input("Your choice? "): self._save(to_save)
 
-        preferred_key = self._get_info(
-            table_name = "OriginalToPreferred",
-            primary_key_name = "original_tags",
-            primary_key_value = original_key,
-            target_key_name = "Preferred_tags"
-        )
-        main_tag = self._get_info(
-            table_name = "PreferredToMain",
-            primary_key_name = "preferred_tags",
-            primary_key_value = preferred_key,
-            target_key_name = "main_tag"
-        )
-        abr = self._get_info(
-            table_name = "MainToAbr",
-            primary_key_name = "main_tag",
-            primary_key_value = main_tag,
-            target_key_name = "abr"
-        )
-
-        option = self._fetch("""SELECT category FROM AbrToCategory""")
-        category = self._get_info(
-            table_name = "AbrToCategory",
-            primary_key_name = "abr",
-            primary_key_value = abr,
-            target_key_name = "category",
-            options=option
-        )
-
-        preferred_tags = FandomTaxonomy._get_tags_from_key(preferred_key)
-        return preferred_tags, main_tag, abr, category
+        return [FandomTaxonomy._get_tags_from_key(key)
+            for key in [preferred_key, main_tag, abr, category]]
 
 
     def close(self):
@@ -207,7 +225,6 @@ class FandomTaxonomySQLite(FandomTaxonomy):
         self._connection.close()
 
 
-
 class FandomTaxonomyCSV(FandomTaxonomy):
     """ Fandom taxonomy: from parent work fandom tags, preferred podficcer fandom tags,
     abbreviation and fandom categories.
@@ -227,14 +244,62 @@ class FandomTaxonomyCSV(FandomTaxonomy):
         "categories"]
 
     def __init__(self):
-        if exists(FandomTaxonomyCSV.csv_path):
-            self._df = read_csv(FandomTaxonomyCSV.csv_path)
-        else:
-            self._df = DataFrame(columns=FandomTaxonomyCSV.columns)
-            self._save()
-
-    def _save(self):
-        self._df.to_csv(FandomTaxonomyCSV.csv_path, index=False)
+        # Rows saved but not written yet, None to write them right away, cf _share
+        self._pending = None
+        if not exists(FandomTaxonomyCSV.csv_path): self._write([])
+        self._load()
+
+    def _load(self):
+        """ Reads the csv file into the indexes, one per column transition, ex: the second one is
+        (original tags, preferred tags) -> [main tracking tag of each matching row] """
+        self._indexes = [{} for _ in FandomTaxonomyCSV.columns[1:]]
+        stats = stat(FandomTaxonomyCSV.csv_path)
+        self._stats = (stats.st_mtime_ns, stats.st_size)
+        with open(FandomTaxonomyCSV.csv_path, "r", newline="", encoding="utf-8") as file:
+            rows = csv_reader(file)
+            next(rows, None)  # header
+            for row in rows:
+                if any(row): self._index(row)
+        for row in self._pending or []:
+            self._index(row)
+
+    def _index(self, row):
+        """ Adds the row to the indexes, short rows are padded with empty values """
+        row = row + [""] * (len(FandomTaxonomyCSV.columns) - len(row))
+        for i, index in enumerate(self._indexes):
+            index.setdefault(tuple(row[:i+1]), []).append(row[i+1])
+
+    def _share(self):
+        """ The shared instance keeps the saved rows and writes them all at once at exit """
+        self._pending = []
+        atexit_register(self.flush)
+
+    def _refresh(self):
+        if not exists(FandomTaxonomyCSV.csv_path): self._write([])
+        stats = stat(FandomTaxonomyCSV.csv_path)
+        if (stats.st_mtime_ns, stats.st_size) != self._stats: self._load()
+
+    def _write(self, rows):
+        """ Appends the rows to the csv file, creating it with the header if needed """
+        new = not exists(FandomTaxonomyCSV.csv_path)
+        with open(FandomTaxonomyCSV.csv_path, "a", newline="", encoding="utf-8") as file:
+            writer = csv_writer(file, lineterminator="\n")
+            if new: writer.writerow(FandomTaxonomyCSV.columns)
+            writer.writerows(rows)
+
+    def _save(self, row):
+        """ Writes the row to the csv file, or keeps it for later if shared """
+        self._index(row)
+        if self._pending is None: return self._write([row])
+        self._pending.append(row)
+
+    def flush(self):
+        """ Writes the rows that were kept for later, cf _save """
+        if not self._pending: return
+        self._write(self._pending)
+        self._pending = []
+        stats = stat(FandomTaxonomyCSV.csv_path)
+        self._stats = (stats.st_mtime_ns, stats.st_size)
 
     def get_all_info(self, original_tags):
         """ Gets the preferred fandom tags, the main tracker tag and the fandom cateory from
@@ -246,54 +311,16 @@ class FandomTaxonomyCSV(FandomTaxonomy):
         - ["Batman (Comics)", "Batman - All Media Types"] -> ["Batman (Comics)"]
         - ["Women's Hockey RPF"] -> ["Hockey RPF", "Women's Hockey RPF"] """
 
-        def pick_option(to_pick, based_on, options=[]):
-            """ Offers the user all given options and to add a new one. Returns their choice. """
-
-            # print options
-            print(f"\nWhich {to_pick} for {based_on}? You can:",
-                "\n- Pick a number",
-                "\n- Hit return for the first item in the list (if any)",
-                "\n- Or type the new value directly (separated with ', ' if it's a list)")
-            for i, option in enumerate(options):
-                print(f"{i}) {option}")
-
-            # get user's choice
-            choice = input("Your choice? ")
-            # hit return, but no list to pick from
-            if not choice and not options:
-                print("We're going to need a value...")
-                return pick_option(to_pick, based_on, options)
-            # hit return, picking first option in the list
-            elif not choice:
-                n_option = 0
-            else:
-                # input a number from the list
-                try:
-                    n_option = int(choice)
-                    if n_option < 0 or n_option >= len(options):
-                        print("Invalid choice")
-                        return pick_option(to_pick, based_on, options)
-                # anything else will be interpreted as a new value
-                except ValueError:
-                    return choice
-
-            return options[n_option]
-
         # results
         res = [FandomTaxonomy._get_canonical_key(original_tags)]
-        # (known, to_pick) pairs of categories
-        categories = [(FandomTaxonomyCSV.columns[i], FandomTaxonomyCSV.columns[i+1])
-            for i in range(len(FandomTaxonomyCSV.columns) - 1)]
-        # dataframe of candidate rows
-        candidates = self._df
-        
-        for known, to_pick in categories:
-            # filter down candidates
-            candidates = candidates.loc[candidates[known]==res[-1]]
-            # get value for next category
-            res.append(pick_option(to_pick, res[-1], list(candidates[to_pick])))
-
-        if candidates.empty:
+
+        for to_pick, index in zip(FandomTaxonomyCSV.columns[1:], self._indexes):
+            # values of the rows matching all the results so far
+            options = index.get(tuple(res), [])
+            res.append(FandomTaxonomy._pick_option(to_pick, res[-1], list(options)))
+
+        # no row matching all the results but the category
+        if tuple(res[:-1]) not in self._indexes[-1]:
             categories = FandomTaxonomyCSV.columns
             print("You chose:")
             print(*[f"\n{category} -> {content}" for category, content in zip(categories, res)])
@@ -301,9 +328,7 @@ class FandomTaxonomyCSV(FandomTaxonomy):
             print("- No (hit return without typing anything)")
             print("- Yes (type anything then hit return)")
             if input("Your choice? "):
-                to_concat = DataFrame({category:[res] for category, res in zip(categories, res)})
-                self._df = concat([self._df, to_concat], ignore_index=True)
-                self._save()
+                self._save(res)
 
         # turn key blobs into lists
         # also, remove canoncical tags from results
@@ -314,4 +339,59 @@ class FandomTaxonomyCSV(FandomTaxonomy):
 
 
     def close(self):
-        """ Unused, here for compatibility with SQLite version. """
+        """ Writes the rows kept for later, if any """
+        self.flush()
+
+
+def csv_to_sqlite(csv_path=None, db_path=None):
+    """ Adds the rows of the CSV taxonomy to the SQLite one
+    Where the CSV has several values for one key, the first one is kept """
+    csv_path = csv_path if csv_path else FandomTaxonomyCSV.csv_path
+    taxonomy = FandomTaxonomySQLite(db_path)
+    with open(csv_path, "r", newline="", encoding="utf-8") as file:
+        rows = csv_reader(file)
+        next(rows, None)  # header
+        # Short rows only have the values they have
+        taxonomy._save([(table_name, row[i], row[i+1]) for row in rows
+            for i, table_name in enumerate(FandomTaxonomySQLite.tables)
+            if i + 1 < len(row) and row[i] and row[i+1]])
+    taxonomy.close()
+
+def sqlite_to_csv(db_path=None, csv_path=None):
+    """ Writes the SQLite taxonomy to the CSV file, one row per original tags
+    Original tags without a value all the way to the category are left out """
+    csv_path = csv_path if csv_path else FandomTaxonomyCSV.csv_path
+    taxonomy = FandomTaxonomySQLite(db_path)
+    rows = taxonomy._connection.execute("""SELECT o.original_tags, o.preferred_tags,
+        p.main_tag, m.abr, a.category
+        FROM OriginalToPreferred o
+        JOIN PreferredToMain p ON p.preferred_tags = o.preferred_tags
+        JOIN MainToAbr m ON m.main_tag = p.main_tag
+        JOIN AbrToCategory a ON a.abr = m.abr
+        ORDER BY o.original_tags""").fetchall()
+    taxonomy.close()
+    content = StringIO()
+    writer = csv_writer(content, lineterminator="\n")
+    writer.writerow(FandomTaxonomyCSV.columns)
+    writer.writerows(rows)
+    atomic_write(csv_path, content.getvalue())
+
+
+# SQLite if there's a database, cf csv_to_sqlite
+DefaultFandomTaxonomy = FandomTaxonomySQLite if exists(FandomTaxonomySQLite.db_path) \
+    else FandomTaxonomyCSV
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="Fandom taxonomy migration",
+        description="Copies the fandom taxonomy from the CSV file to the SQLite database, " + \
+            "which is then used instead, or back")
+    parser.add_argument('direction', choices=["to-sqlite", "to-csv"])
+    parser.add_argument('--csv', help="path to the CSV file", default=FandomTaxonomyCSV.csv_path)
+    parser.add_argument('--db', help="path to the SQLite database",
+        default=FandomTaxonomySQLite.db_path)
+    args = parser.parse_args()
+
+    if args.direction == "to-sqlite": csv_to_sqlite(args.csv, args.db)
+    else: sqlite_to_csv(args.db, args.csv)
+    print("Done!")
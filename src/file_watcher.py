@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+""" Watching the project folders for new, removed or finished files (Linux only, inotify)
+Keeps FileTracker's folder scans up to date as files change, instead of listing the folders again """
+
+from bisect import insort
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from os import close, fsencode, fsdecode, read, scandir, stat, strerror
+from os.path import join
+from select import select
+from struct import calcsize, unpack_from
+from typing import Callable, Dict, List, Optional
+from src.base_object import BaseObject
+from src.project_files_tracker import FileTracker, _scanned_folders
+
+
+# inotify constants, from sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# struct inotify_event: int wd, uint32_t mask, uint32_t cookie, uint32_t len, char name[len]
+event_format = "iIII"
+event_size = calcsize(event_format)
+
+project_folder_mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE \
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+wips_folder_mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+
+class FileWatcherError(Exception):
+    pass
+
+
+class Inotify:
+    """ Minimal inotify binding through ctypes """
+
+    def __init__(self) -> None:
+        self._libc = CDLL(find_library("c"), use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise FileWatcherError("inotify isn't available on this system")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0: raise OSError(get_errno(), strerror(get_errno()))
+
+    def add_watch(self, path:str, mask:int) -> int:
+        """ Watches the path, returns the watch descriptor """
+        wd = self._libc.inotify_add_watch(self.fd, fsencode(path), mask)
+        if wd < 0: raise OSError(get_errno(), strerror(get_errno()), path)
+        return wd
+
+    def rm_watch(self, wd:int) -> None:
+        """ Stops watching, errors are ignored since the path may be gone already """
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout:Optional[float]=None) -> List[tuple]:
+        """ Returns the (watch descriptor, mask, cookie, name) events, waiting for up to timeout
+        seconds (forever if None) if there are none yet """
+        ready, _, _ = select([self.fd], [], [], timeout)
+        if not ready: return []
+        try: buffer = read(self.fd, 64 * 1024)
+        except BlockingIOError: return []
+        events, offset = [], 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = unpack_from(event_format, buffer, offset)
+            name = buffer[offset+event_size:offset+event_size+length].rstrip(b"\0")
+            events.append((wd, mask, cookie, fsdecode(name)))
+            offset += event_size + length
+        return events
+
+    def close(self) -> None:
+        close(self.fd)
+
+
+class FileWatcher(BaseObject):
+    """ Watches wips_folder and every project folder in it
+
+    The FileTracker scan of every watched folder is kept up to date, so update_file_paths doesn't
+    need to list the folder again. Callbacks registered with on_change are called with
+    (folder, file name, change), change being:
+    - created: the file was created, it may still be getting written to
+    - moved in: the file was moved or renamed into the folder
+    - removed: the file was deleted or moved out of the folder
+    - written: the file was closed after being written to, ex: an audio export is done
+    ex: watcher = FileWatcher(); watcher.on_change(callback); watcher.run() """
+
+    def __init__(self, wips_folder:Optional[str]=None, verbose:bool=True) -> None:
+        super().__init__(verbose)
+        self.wips_folder = wips_folder if wips_folder else FileTracker.wips_folder
+        self._inotify = Inotify()
+        self._ext_groups = FileTracker._get_ext_groups()
+        self._callbacks:List[Callable[[str, str, str], None]] = []
+        self._folders:Dict[int, str] = {}  # watch descriptor -> folder
+        self._running = False
+        self._root = self._inotify.add_watch(self.wips_folder, wips_folder_mask)
+        self._watch_all()
+
+    def on_change(self, callback:Callable[[str, str, str], None]) -> None:
+        """ Registers a callback(folder, file name, change), cf FileWatcher """
+        self._callbacks.append(callback)
+
+    def _watch_all(self) -> None:
+        """ Watches all the project folders """
+        self._vprint(f"Watching {self.wips_folder}...", end=" ")
+        with scandir(self.wips_folder) as entries:
+            for entry in entries:
+                if entry.is_dir(): self._watch(entry.path)
+        self._vprint(f"Done! {len(self._folders)} folders")
+
+    def _watch(self, folder:str) -> None:
+        """ Watches the project folder, then scans it
+        Changes made after the watch was added come as events, so the scan can be trusted even if
+        the folder was modified very recently """
+        try: wd = self._inotify.add_watch(folder, project_folder_mask)
+        except FileNotFoundError: return
+        self._folders[wd] = folder
+        self._rescan(folder)
+
+    def _rescan(self, folder:str) -> None:
+        """ Scans the folder again, and keeps the scan regardless of how recent the changes are """
+        _scanned_folders.pop(folder, None)
+        try:
+            scanned = FileTracker._scan(folder)
+            _scanned_folders[folder] = (stat(folder).st_mtime_ns, scanned)
+        except FileNotFoundError:
+            pass
+
+    def _update_scan(self, folder:str, name:str, added:bool) -> None:
+        """ Adds or removes the file from the folder's scan """
+        cached = _scanned_folders.get(folder)
+        if not cached: return self._rescan(folder)
+        scanned = {group: list(files) for group, files in cached[1].items()}
+        for group in FileTracker._get_groups(name, self._ext_groups):
+            entry = (name, name.lower())
+            if added and entry not in scanned[group]: insort(scanned[group], entry)
+            elif not added and entry in scanned[group]: scanned[group].remove(entry)
+        try: _scanned_folders[folder] = (stat(folder).st_mtime_ns, scanned)
+        except FileNotFoundError: _scanned_folders.pop(folder, None)
+
+    def _unwatch(self, wd:int) -> None:
+        """ Forgets the folder, after it was removed or moved away """
+        folder = self._folders.pop(wd, None)
+        if folder: _scanned_folders.pop(folder, None)
+
+    def _notify(self, folder:str, name:str, change:str) -> None:
+        for callback in self._callbacks:
+            callback(folder, name, change)
+
+    def _handle(self, wd:int, mask:int, name:str) -> None:
+        """ Applies one event """
+        if mask & IN_Q_OVERFLOW:
+            # Events were lost, everything has to be scanned again
+            self._vprint("Too many changes at once, scanning all the folders again")
+            for folder in self._folders.values(): self._rescan(folder)
+            return
+        if wd == self._root:
+            if not mask & IN_ISDIR: return
+            folder = join(self.wips_folder, name)
+            if mask & (IN_CREATE | IN_MOVED_TO): self._watch(folder)
+            else:
+                for folder_wd in [key for key, path in self._folders.items() if path == folder]:
+                    self._inotify.rm_watch(folder_wd)
+                    self._unwatch(folder_wd)
+            return
+        folder = self._folders.get(wd)
+        if folder is None: return
+        if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+            self._unwatch(wd)
+        elif mask & IN_ISDIR:
+            return
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            self._update_scan(folder, name, added=True)
+            self._notify(folder, name, "created" if mask & IN_CREATE else "moved in")
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self._update_scan(folder, name, added=False)
+            self._notify(folder, name, "removed")
+        elif mask & IN_CLOSE_WRITE:
+            self._notify(folder, name, "written")
+
+    def poll(self, timeout:Optional[float]=0) -> int:
+        """ Applies the pending events, waiting for up to timeout seconds (forever if None) if
+        there are none yet, returns the number of events """
+        events = self._inotify.read_events(timeout)
+        for wd, mask, _, name in events:
+            self._handle(wd, mask, name)
+        return len(events)
+
+    def run(self, timeout:float=1.) -> None:
+        """ Applies the events as they come, until stop is called (from a callback or another
+        thread) """
+        self._running = True
+        while self._running:
+            self.poll(timeout)
+
+    def stop(self) -> None:
+        self._running = False
+
+    def close(self) -> None:
+        """ Stops watching everything """
+        self._inotify.close()
+        for folder in self._folders.values(): _scanned_folders.pop(folder, None)
+        self._folders = {}
@@ -10,6 +10,7 @@ from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 from typing import Optional
 from src.base_object import BaseObject
+from src.content_hashes import ContentHashStore
 from src.project import Project
 
 
@@ -28,6 +29,8 @@ class GDriveUploader(BaseObject):
 
     # The name of the folder with all the podfic subfolders
     podfic_folder_path = "podfic files"
+    # If set, files that haven't changed since they were last uploaded to the folder are skipped
+    content_hashes:Optional[ContentHashStore] = None
 
     def __init__(self, verbose:bool=True) -> None:
         super().__init__(verbose)
@@ -74,12 +77,17 @@ class GDriveUploader(BaseObject):
     def upload_file(self, path) -> None:
         """ Uploads the given file to the project's gdrive folder
         :args path: str, path to the file """
+        hashes = GDriveUploader.content_hashes
+        if hashes and not hashes.changed_since("gdrive upload", [path], self._folder['id']):
+            self._vprint(f"{path} (unchanged, skipping)")
+            return
         self._vprint(f"{path}")
         file = self._drive.CreateFile()
         file.SetContentFile(path)
         file["title"] = basename(path)
         file["parents"] = [{"id": self._folder['id']}]
         file.Upload()
+        if hashes: hashes.mark_done("gdrive upload", [path], self._folder['id'])
 
 
     def _get_child_id(self, parent_id:str, child_name:str) -> Optional[str]:
@@ -2,142 +2,270 @@
 # -*- coding: utf-8 -*-
 """ Extracting data from parent work html
 No argparse/main
-NOTE had to add the re.DOTALL flag in _get_summaries, might have to everywhere else, too
+Each work is parsed in one pass over its preface (everything before the work text), with the
+patterns below, compiled once. Only the preface is read from the file
  """
 
-from re import search as re_search, findall as re_findall, DOTALL
+from concurrent.futures import ProcessPoolExecutor
+from json import load as js_load, dumps as js_dumps
+from os import cpu_count
+from os.path import exists, join
+from re import compile as re_compile
+from typing import Any, Dict, List, Optional, Tuple
 from src.base_object import BaseObject, DebugError
+from src.content_hashes import ContentHashStore
+from src.project_files_tracker import FileTracker
+from src.write_behind import atomic_write
 
 
-def flatten(list_of_lists):
-    """ Aux function, flattens a list of lists into a list """
+# To increase when parse_work changes, so that the works cached with the previous version are
+# parsed again, cf ParentWorkCache
+parser_version = 2
+# The work text starts there, everything that's extracted is before it, wordcount included
+preface_end = '<div id="chapters"'
+# Characters read at once from the html files, until preface_end is found
+read_size = 1 << 16
+# &amp; last, so that ex: "&amp;lt;" is decoded to "&lt;"
+html_entities = {"&#39;": "'", "&quot;": '"', "&gt;": ">", "&lt;": "<", "&amp;": "&"}
+# One alternative per field, so that the preface is only scanned once. The html is matched before
+# being decoded, so that the values can't contain the tags around them, ex: [^<]* for a tag name
+preface_regex = re_compile(
+    r'<(?:dt>(?P<label>[^<]*):</dt>\s+<dd>(?P<value>[^<]*(?:<(?!/dd>)[^<]*)*)</dd>'
+    r'|h1>(?P<title>[^<]*(?:<(?!/h1>)[^<]*)*)</h1>'
+    r'|div class="byline">by (?P<byline>[^<]*(?:<(?!/div>)[^<]*)*)</div>'
+    r'|p>Summary</p>\s+<blockquote class="userstuff">(?:<p>)?'
+    r'(?P<summary>[^<]*(?:<(?!/p></blockquote>)[^<]*)*)</p></blockquote>)'
+    r'|Posted originally on the <a href="https?://archiveofourown\.org/">Archive of Our Own</a>'
+    r' at <a href="(?P<url>[^"]*)">')
+author_regex = re_compile(r'<a rel="author" href="([^"]*)">([^<]*)</a>')
+tag_regex = re_compile(r'<a href="https?://archiveofourown\.org/tags/[^"]*">([^<]*)</a>')
+series_regex = re_compile(r'<a href="https?://archiveofourown\.org/series/[0-9]*">([^<]*)</a>')
+words_regex = re_compile(r'Words: ([0-9,]+)')
+# Preface labels (singular or plural) -> metadata field
+tag_fields = {
+    "Rating": "Rating",
+    "Archive Warning": "Archive Warnings",
+    "Category": "Categories",
+    "Fandom": "Fandoms",
+    "Relationship": "Relationships",
+    "Character": "Characters",
+    "Additional Tag": "Additional Tags"}
+tag_labels = {**tag_fields, **{field: field for field in tag_fields.values()},
+    "Ratings": "Rating",
+    # Kept apart, the categories under singular labels come first, cf extract_html_data
+    "Categories": "Plural Categories"}
+
+
+def decode_html(html_string:str) -> str:
+    """ Returns the ASCII decoded version of the given HTML string
+    This does NOT remove normal HTML tags like <p> """
+    if "&" not in html_string: return html_string
+    for code, character in html_entities.items():
+        html_string = html_string.replace(code, character)
+    return html_string
+
+def decode_all(html_strings:List[str]) -> List[str]:
+    """ Decodes all the strings at once, ex: all the tags of a field """
+    return decode_html("\0".join(html_strings)).split("\0") if html_strings else []
+
+def get_preface(html_string:str) -> str:
+    """ Returns the part of the html before the work text """
+    end = html_string.find(preface_end)
+    return html_string if end == -1 else html_string[:end]
+
+def read_preface(path:str) -> str:
+    """ Reads the file until the end of the preface, or the whole file if it can't be found """
+    chunks, tail = [], ""
+    with open(path, 'r') as file:
+        for chunk in iter(lambda: file.read(read_size), ""):
+            chunks.append(chunk)
+            # The end of the previous chunk is searched again, in case the marker was split
+            end = (tail + chunk).find(preface_end)
+            if end != -1:
+                preface = "".join(chunks)
+                return preface[:len(preface) - len(tail) - len(chunk) + end]
+            tail = (tail + chunk)[-len(preface_end)+1:]
+    return "".join(chunks)
+
+def flatten(list_of_lists:List[List]) -> List:
+    """ Flattens a list of lists into a list """
     return [item for sublist in list_of_lists for item in sublist]
 
-def remove_dup(list_of_items):
-    """ Aux function, removes duplicates from list """
-    new = []
-    for item in list_of_items:
-        if item not in new:
-            new.append(item)
-    return new
+def dedup(items:List) -> List:
+    """ Removes duplicates, keeping the first occurrence of each item """
+    return list(dict.fromkeys(items))
+
+
+def parse_work(html_string:str) -> Dict[str, Any]:
+    """ Extracts all the fields of one work, in one pass over the preface, and decodes them
+    Returns {urls, title, authors, series, summary, wordcount, language} and the tag fields
+    (cf tag_labels), None or empty if not found """
+    work = {"urls": [], "title": None, "authors": [], "series": [], "summary": None,
+        "wordcount": None, "language": None}
+    work.update({field: [] for field in tag_labels.values()})
+    for found in preface_regex.finditer(get_preface(html_string)):
+        kind = found.lastgroup
+        if kind == "url":
+            work["urls"].append(decode_html(found.group("url")))
+        elif kind == "value":
+            label, value = found.group("label"), found.group("value")
+            if label in tag_labels:
+                work[tag_labels[label]] += decode_all(tag_regex.findall(value))
+            elif label == "Language" and work["language"] is None:
+                work["language"] = decode_html(value)
+            elif label == "Series":
+                work["series"] += decode_all(series_regex.findall(value))
+            elif label == "Stats" and work["wordcount"] is None:
+                words = words_regex.search(value)
+                if words: work["wordcount"] = int(words.group(1).replace(",", ""))
+        elif kind in ["title", "summary"] and work[kind] is None:
+            work[kind] = decode_html(found.group(kind))
+        elif kind == "byline" and not work["authors"]:
+            authors = decode_all(flatten(author_regex.findall(found.group("byline"))))
+            work["authors"] = list(zip(authors[::2], authors[1::2]))
+    return work
+
+def _parse_file(path:str) -> Dict[str, Any]:
+    """ Parses one html file, cf parse_work, module-level so that it can be sent to other
+    processes """
+    return parse_work(read_preface(path))
+
+
+class ParentWorkCache(BaseObject):
+    """ Parsed parent works (cf parse_work), keyed by the content hash of their html file, so that
+    a file is only parsed once, even if it's in several project folders
+    The whole cache is dropped when parser_version changes """
+
+    def __init__(self, cache_path:Optional[str]=None,
+        content_hashes:Optional[ContentHashStore]=None, verbose:bool=True) -> None:
+        super().__init__(verbose)
+        self.cache_path = cache_path if cache_path \
+            else join(FileTracker.wips_folder, "parent_works.json")
+        # Not the posting steps' hashes.json (cf cli/post.py): the whole file is rewritten on
+        # save, a setup and a post running at the same time would drop each other's records
+        self.content_hashes = content_hashes if content_hashes else ContentHashStore(
+            join(FileTracker.wips_folder, "parent_works_hashes.json"), verbose=verbose)
+        self._works:Dict[str, Dict[str, Any]] = {}  # content hash -> work
+        if exists(self.cache_path):
+            with open(self.cache_path, "r") as file:
+                saved = js_load(file)
+            if saved["version"] == parser_version: self._works = saved["works"]
+
+    def get(self, path:str) -> Optional[Dict[str, Any]]:
+        """ Returns the parsed work, or None if the file wasn't parsed yet """
+        work = self._works.get(self.content_hashes.hash(path))
+        if work is None: return None
+        # Saved as json lists
+        return {**work, "authors": [tuple(author) for author in work["authors"]]}
+
+    def add(self, path:str, work:Dict[str, Any]) -> None:
+        self._works[self.content_hashes.hash(path)] = work
+
+    def save(self) -> None:
+        """ Saves the parsed works, and the file hashes so that the files aren't hashed again """
+        atomic_write(self.cache_path, js_dumps({"version": parser_version, "works": self._works}))
+        self.content_hashes.save()
 
 
 class HTMLExtractor(BaseObject):
     """ Data extraction from downloaded ao3 html files using regex
-    Use extract_html_data to get the info """
+    Use extract_html_data to get the info
+    With parallel, each file is parsed in a separate process. By default, that's only done for
+    at least parallel_threshold files, since starting the processes takes longer than parsing a
+    few prefaces
+    If cache is set, the files that were already parsed aren't parsed again, cf ParentWorkCache """
+
+    parallel_threshold = 32
+    workers:Optional[int] = None  # cpu_count if None
+    cache:Optional[ParentWorkCache] = None
 
-    def __init__(self, html_file_paths, verbose=True):
+    def __init__(self, html_file_paths:List[str], verbose:bool=True,
+        parallel:Optional[bool]=None) -> None:
         super().__init__(verbose)
-        self._load_html(html_file_paths)
-
-
-    def _load_html(self, file_paths):
-        """ Loads html files into html_works attribute """
-
-        def decode_func(html_string):
-            """ Returns the ASCII decoded version of the given HTML string
-            This does NOT remove normal HTML tags like <p> """
-            html_codes = (
-                    ("'", '&#39;'),
-                    ('"', '&quot;'),
-                    ('>', '&gt;'),
-                    ('<', '&lt;'),
-                    ('&', '&amp;'))
-            for code in html_codes:
-                html_string = html_string.replace(code[1], code[0])
-            return html_string
-
-        self._html_works = []
-        for path in file_paths:
-            with open(path, 'r') as file:
-                self._html_works.append(decode_func(file.read()))
-
-
-    def _get_series(self):
-        """ Extracts and returns series titles """
-        regex = r"""<dt>Series:<\/dt>
-        <dd>Part [0-9]+ of
-<a href="http[s]?:\/\/archiveofourown.org\/series\/[0-9]*">(.*?)<\/a><\/dd>"""
-        series = [re_findall(regex, work) for work in self._html_works]
-        series = remove_dup(flatten(series))
-        return series
-
-
-    def _get_authors(self):
-        """ Extracts and returns authors (url, pseud) """
-        # Get author credits section
-        regex = r"""<div class="byline">by (.*?)</div>"""
-        blobs = [re_search(regex, work).group() for work in self._html_works]
-        # Extract all (link, pseud) pairs from credit section
-        regex = r"""<a rel="author" href="(.*?)">(.*?)<\/a>"""
-        authors = [re_findall(regex, blob) for blob in blobs]
-        authors = remove_dup(flatten(authors))
-        return authors
-
-
-    def _get_titles(self):
-        """ Extracts and returns fic titles """
-        regex = r"<h1>(.*?)<\/h1>"
-        titles = [re_search(regex, work).group()[4:-5] for work in self._html_works]
-        return titles
-
-
-    def _get_wordcount(self):
-        """ Extracts, sums up and returns total wordcount """
-        regex = """<dt>Stats:<\/dt>[\s\n]+<dd>[\s\n]+Published: [0-9-]+""" + \
-            """([\s\n]+Updated: [0-9-]+)?""" + \
-            """([\s\n]+Completed: [0-9-]+)?""" + \
-            """[\s\n]+Words: (((?P<millions>[0-9]+),|)(?P<thousands>[0-9]+),|)(?P<units>[0-9]+)"""
-        wordcounts = []
-        for work in self._html_works:
-            found = re_search(regex, work)
-            if found is None: raise DebugError("Wordcount search failed")
-            wordcount = found.group("millions") if not found.group("millions") is None else ""
-            wordcount += found.group("thousands") if not found.group("thousands") is None else ""
-            wordcount += found.group("units")
-            wordcount = int(wordcount)
-            wordcounts.append(wordcount)
-        return sum(wordcounts)
-
-
-    def _get_summaries(self):
-        """ Extracts and returns summaries """
-        regex = r"""<p>Summary<\/p>"""+\
-            r"""[\s\n]+<blockquote class="userstuff">(<p>|)([\s\S]*?)<\/p><\/blockquote>"""
-        summaries = [re_findall(regex, work, DOTALL)[0][1] for work in self._html_works]
-        return summaries
-
-    def _get_tags(self, category):
-        """ Extracts and returns tags for the given category """
-        regex = fr"""<dt>{category}[s]*:<\/dt>"""+\
-            r"""[\s\n]+<dd>(.*?)<\/dd>"""
-        tag_soups = [soup for work in self._html_works for soup in re_findall(regex, work)]
-        regex = r"""<a href="http[s]?:\/\/archiveofourown.org\/tags\/(.*?)">(.*?)<\/a>"""
-        tags = [tag for soup in tag_soups for end_url, tag in re_findall(regex, soup)]
-        tags = remove_dup(tags)
-        return tags
-
-
-    def _get_urls(self):
-        """ Extracts and returns work urls """
-        regex = r"""Posted originally on the <a href="http[s]?:\/\/archiveofourown.org\/">""" \
-            + r"""Archive of Our Own<\/a> at <a href="(.*?)">"""
-        urls = [re_findall(regex, work) for work in self._html_works]
-        return  flatten(urls)
-    
-
-    def _get_language(self):
-        """ Extracts and returns work language """
-        regex = fr"""<dt>Language:</dt>"""+\
-            r"""[\s\n]+<dd>(.*?)</dd>"""
-        languages = [re_findall(regex, work)[0] for work in self._html_works]
-        languages = remove_dup(languages)
+        self._load_html(html_file_paths, parallel)
+
+
+    @staticmethod
+    def _parse_files(file_paths:List[str], parallel:Optional[bool]=None) -> List[Dict[str, Any]]:
+        """ Parses the html files, in the order of the files """
+        if parallel is None: parallel = len(file_paths) >= HTMLExtractor.parallel_threshold
+        workers = min(HTMLExtractor.workers or cpu_count() or 1, len(file_paths))
+        if not parallel or workers < 2:
+            return [_parse_file(path) for path in file_paths]
+        with ProcessPoolExecutor(workers) as executor:
+            chunksize = max(1, len(file_paths) // (4 * workers))
+            return list(executor.map(_parse_file, file_paths, chunksize=chunksize))
+
+
+    def _load_html(self, file_paths:List[str], parallel:Optional[bool]=None) -> None:
+        """ Parses the html files into the works attribute, one dict of fields per work, in the
+        order of the files """
+        cache = HTMLExtractor.cache
+        if cache is None:
+            self._works = HTMLExtractor._parse_files(file_paths, parallel)
+            return
+        self._works = [cache.get(path) for path in file_paths]
+        to_parse = [i for i, work in enumerate(self._works) if work is None]
+        if not to_parse: return
+        parsed = HTMLExtractor._parse_files([file_paths[i] for i in to_parse], parallel)
+        for i, work in zip(to_parse, parsed):
+            self._works[i] = work
+            cache.add(file_paths[i], work)
+        cache.save()
+
+
+    def _get_series(self) -> List[str]:
+        """ Returns series titles """
+        return dedup(series for work in self._works for series in work["series"])
+
+
+    def _get_authors(self) -> List[Tuple[str, str]]:
+        """ Returns authors (url, pseud) """
+        return dedup(author for work in self._works for author in work["authors"])
+
+
+    def _get_titles(self) -> List[str]:
+        """ Returns fic titles """
+        if any(work["title"] is None for work in self._works):
+            raise DebugError("Title search failed")
+        return [work["title"] for work in self._works]
+
+
+    def _get_wordcount(self) -> int:
+        """ Returns the total wordcount """
+        if any(work["wordcount"] is None for work in self._works):
+            raise DebugError("Wordcount search failed")
+        return sum(work["wordcount"] for work in self._works)
+
+
+    def _get_summaries(self) -> List[str]:
+        """ Returns summaries """
+        if any(work["summary"] is None for work in self._works):
+            raise DebugError("Summary search failed")
+        return [work["summary"] for work in self._works]
+
+
+    def _get_tags(self, field:str) -> List[str]:
+        """ Returns the tags for the given field, ex: Fandoms """
+        return dedup(tag for work in self._works for tag in work[field])
+
+
+    def _get_urls(self) -> List[str]:
+        """ Returns work urls """
+        return [url for work in self._works for url in work["urls"]]
+
+
+    def _get_language(self) -> str:
+        """ Returns work language """
+        if any(work["language"] is None for work in self._works):
+            raise DebugError("Language search failed")
+        languages = dedup(work["language"] for work in self._works)
         if len(languages) > 1:
-            self._vprint("Found several languages in parent works:", ", ".join(languages))
+            self._vprint(f"Found several languages in parent works: {', '.join(languages)}")
         return languages[0]
 
 
-    def extract_html_data(self):
+    def extract_html_data(self) -> Dict[str, Any]:
         """ Extracts and returns all info """
         self._vprint('Extracting data from parent work(s) html file(s)...', end=" ")
         to_return = {
@@ -148,15 +276,16 @@ class HTMLExtractor(BaseObject):
             "Wordcount": self._get_wordcount(),
             "Language": self._get_language(),
 
-            "Archive Warnings": self._get_tags("Archive Warning")+self._get_tags("Archive Warnings"),
+            "Archive Warnings": self._get_tags("Archive Warnings"),
             "Rating": self._get_tags("Rating")[0],
-            "Categories": self._get_tags("Category")+self._get_tags("Categories"),
-            "Fandoms": self._get_tags("Fandom"),
-            "Relationships": self._get_tags("Relationship"),
-            "Characters": self._get_tags("Character"),
-            "Additional Tags": self._get_tags("Additional Tag")
+            "Categories": dedup(self._get_tags("Categories") \
+                + self._get_tags("Plural Categories")),
+            "Fandoms": self._get_tags("Fandoms"),
+            "Relationships": self._get_tags("Relationships"),
+            "Characters": self._get_tags("Characters"),
+            "Additional Tags": self._get_tags("Additional Tags")
         }
-        
+
         try:
             to_return["Archive Warnings"].remove("Creator Chose Not To Use Archive Warnings")
             to_return["Archive Warnings"].append("Choose Not To Use Archive Warnings")
@@ -7,6 +7,7 @@ from sys import exit
 from internetarchive import upload, get_item
 from typing import Optional
 from src.base_object import BaseObject
+from src.content_hashes import ContentHashStore
 from src.project import Project
 from src.project_metadata import placeholder_text, PlaceholderValue
 
@@ -28,6 +29,9 @@ class IAUploader(BaseObject):
     - upload_info
     - update_descrition """
 
+    # If set, files that haven't changed since they were last uploaded to the item are skipped
+    content_hashes:Optional[ContentHashStore] = None
+
     def __init__(self, verbose:bool=True) -> None:
         super().__init__(verbose)
     
@@ -90,6 +94,10 @@ class IAUploader(BaseObject):
 
     def _upload_file(self, file_path):
         """ Uploads the given file to the ia item """
+        hashes = IAUploader.content_hashes
+        if hashes and not hashes.changed_since("ia upload", [file_path], self._identifier):
+            self._vprint(f'unchanged, skipping - {file_path}')
+            return
         request = upload(
             self._identifier,
             files = [file_path],
@@ -98,6 +106,7 @@ class IAUploader(BaseObject):
             retries_sleep = 2
         )
         self._vprint(f'{request[0].status_code} - {file_path}')
+        if hashes and request[0].ok: hashes.mark_done("ia upload", [file_path], self._identifier)
 
 
     def upload_compressed_audio(self) -> None:
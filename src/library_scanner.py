@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+""" Finding all the project folders in wips_folder, and which project they're for
+The folders are listed in parallel, and the results are kept in an index file so that only the
+folders modified since the last scan are listed again """
+
+from concurrent.futures import ThreadPoolExecutor
+from json import load as js_load, dumps as js_dumps
+from os import scandir
+from os.path import basename, exists, join
+from re import compile as re_compile
+from typing import Any, Dict, List, Optional
+from src.base_object import BaseObject
+from src.project_files_tracker import FileTracker
+from src.project_id import ProjectID
+from src.write_behind import atomic_write
+
+
+# "hrpf - st", cf FileTracker._get_folder
+folder_name_regex = re_compile(r"^(?P<fandom>[^ ]+) - (?P<title_abr>\w+)$")
+# "st metadata.yaml", cf FileTracker.__init__
+metadata_file_regex = re_compile(r"^(?P<title_abr>.+) metadata\.yaml$")
+# "[HRPF] Some title.mp3", cf ProjectID.full_safe_title
+formatted_file_regex = re_compile(r"^\[(?P<fandom>[^\]]+)\] (?P<title>.+)\.[^.]+$")
+
+
+def get_folder_id(folder:str) -> Optional[str]:
+    """ "wips_folder/hrpf - st" -> "hrpf-st", None if the folder isn't named that way """
+    found = folder_name_regex.match(basename(folder))
+    if not found: return None
+    return "-".join([found.group("fandom"), found.group("title_abr")]).lower()
+
+def get_title_abr(title:str) -> str:
+    """ "Some title" -> "st", cf ProjectID """
+    project_id = ProjectID.__new__(ProjectID)
+    project_id.raw_title = title
+    return project_id._get_title_abr()
+
+
+class LibraryScanner(BaseObject):
+    """ Index of the project folders: folder -> {fandom_abr, title_abr, id, source, mtime}
+
+    fandom_abr and title_abr are inferred from (source):
+    - the folder name, "fandom - title_abr", the way FileTracker names them
+    - the metadata file, "title_abr metadata.yaml", and a formatted audio or cover file,
+      "[FANDOM] title.mp3", for folders that were renamed
+    Either can be None if nothing matched. Use scan to update the index, then diff to compare it
+    with a tracker, or find_folders to look a project up. """
+
+    def __init__(self, wips_folder:Optional[str]=None, index_path:Optional[str]=None,
+        workers:int=8, verbose:bool=True) -> None:
+        super().__init__(verbose)
+        self.wips_folder = wips_folder if wips_folder else FileTracker.wips_folder
+        self.index_path = index_path if index_path else join(self.wips_folder, "library.json")
+        self._workers = workers
+        self.index:Dict[str, Dict[str, Any]] = {}
+        if exists(self.index_path):
+            with open(self.index_path, "r") as file:
+                self.index = js_load(file)
+
+    @staticmethod
+    def _scan_folder(folder:str, mtime:int) -> Dict[str, Any]:
+        """ Infers which project the folder is for, from its name and the names of its files """
+        fandom_abr, title_abr, source = None, None, None
+        found = folder_name_regex.match(basename(folder))
+        if found:
+            fandom_abr, title_abr, source = found.group("fandom"), found.group("title_abr"), \
+                "folder name"
+        else:
+            with scandir(folder) as entries:
+                names = sorted(entry.name for entry in entries if entry.is_file())
+            for name in names:
+                found = metadata_file_regex.match(name)
+                if found: title_abr, source = found.group("title_abr"), "file names"
+                found = formatted_file_regex.match(name)
+                if found and not fandom_abr:
+                    fandom_abr, source = found.group("fandom"), "file names"
+                    title_abr = title_abr or get_title_abr(found.group("title"))
+        id = "-".join([fandom_abr, title_abr]).lower() if fandom_abr and title_abr else None
+        return {"fandom_abr": fandom_abr, "title_abr": title_abr, "id": id, "source": source,
+            "mtime": mtime}
+
+    def scan(self) -> Dict[str, Dict[str, Any]]:
+        """ Updates the index with the folders added or modified since the last scan, removes
+        the ones that are gone, and saves it """
+        self._vprint(f"Scanning {self.wips_folder}...", end=" ")
+        with scandir(self.wips_folder) as entries:
+            mtimes = {entry.path: entry.stat().st_mtime_ns for entry in entries if entry.is_dir()}
+        changed = [folder for folder, mtime in mtimes.items()
+            if self.index.get(folder, {}).get("mtime") != mtime]
+        with ThreadPoolExecutor(self._workers) as executor:
+            scanned = executor.map(LibraryScanner._scan_folder, changed,
+                [mtimes[folder] for folder in changed])
+            index = {folder: entry for folder, entry in self.index.items() if folder in mtimes}
+            index.update(zip(changed, scanned))
+        self.index = dict(sorted(index.items()))
+        atomic_write(self.index_path, js_dumps(self.index, indent=4))
+        self._vprint(f"Done! {len(self.index)} folders, {len(changed)} scanned again")
+        return self.index
+
+    def find_folders(self, fandom_abr:str, title_abr:str) -> List[str]:
+        """ Returns the indexed folders for the project """
+        id = "-".join([fandom_abr, title_abr]).lower()
+        return [folder for folder, entry in self.index.items() if entry["id"] == id]
+
+    def diff(self, ids:List[str]) -> Dict[str, List[str]]:
+        """ Compares the index with the tracker's IDs:
+        - new: folders for a project that isn't in the tracker yet
+        - unknown: folders for which no project could be inferred
+        - missing: tracker IDs without a folder """
+        ids = set(ids)
+        indexed = {entry["id"] for entry in self.index.values()}
+        return {
+            "new": [folder for folder, entry in self.index.items()
+                if entry["id"] and entry["id"] not in ids],
+            "unknown": [folder for folder, entry in self.index.items() if not entry["id"]],
+            "missing": sorted(ids - indexed)}
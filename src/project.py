@@ -1,15 +1,24 @@
 # -*- coding: utf-8 -*-
 """ Project info, all of it """
 
-from typing import Optional
+from sqlite3 import connect as sqlite3_connect
+from contextlib import contextmanager
+from copy import deepcopy
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from os import fsync, remove, stat
 from os.path import exists
-from jsonpickle import encode, decode, loads as jsp_loads
+from jsonpickle import loads as jsp_loads
 from jsonpickle.unpickler import Unpickler
-from json import load as js_load, dump as js_dump, loads as js_loads
+from threading import Lock, RLock
+try: from fcntl import flock, LOCK_EX, LOCK_SH, LOCK_UN
+except ImportError: flock = None  # Not on Windows, the tracker isn't locked then
+from json import load as js_load, loads as js_loads, dumps as js_dumps, \
+    JSONDecodeError
 from src.base_object import BaseObject
 from src.html_downloader import HTMLDownloader
 from src.project_id import ProjectID
-from src.project_metadata import ProjectMetadata
+from src.project_metadata import ProjectMetadata, drafted_link, placeholder_text
+from src.write_behind import WriteBehindFlusher, atomic_write
 from src.project_files_tracker import FileTracker
 
 
@@ -20,7 +29,12 @@ class TrackerError(Exception):
 
 
 class Project(BaseObject):
-    """ A project! """
+    """ A project!
+
+    Saved in the tracker as to_dict's output: {"schema": ..., "project_id": ..., "files": ...,
+    "metadata": ...}. Bump schema when that changes, and have from_dict read the older ones """
+
+    schema = 1
 
     def __init__(self, raw_title:str, fandom_abr:str, parent_link:Optional[str]="",
         download_parent:bool=True, reset_metadata:bool=False, verbose:bool=True) -> None:
@@ -46,32 +60,230 @@ class Project(BaseObject):
             self._vprint("Extracting info from yaml file")
             self.metadata = ProjectMetadata(self.files, mode="from yaml", verbose=self._verbose)
 
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the project as a json-compatible dict, cf from_dict """
+        return {
+            "schema": Project.schema,
+            "project_id": self.project_id.to_dict(),
+            "files": self.files.to_dict(),
+            "metadata": self.metadata.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any], verbose:bool=True) -> "Project":
+        """ Rebuilds the project from to_dict's output, without any of the cross-references
+        Also reads projects saved by jsonpickle, before there was a schema """
+        if "py/object" in data: return Unpickler(on_missing="warn").restore(data, reset=True)
+        if data.get("schema") != Project.schema: raise ValueError(
+            f"Unknown project schema {data.get('schema')}, expected {Project.schema}")
+        project = cls.__new__(cls)
+        BaseObject.__init__(project, verbose)
+        project.project_id = ProjectID.from_dict(data["project_id"])
+        project.files = FileTracker.from_dict(data["files"], verbose)
+        project.metadata = ProjectMetadata.from_dict(data["metadata"], verbose)
+        return project
+
 
 class ProjectsTracker(BaseObject):
-    """ A project tracker """
+    """ A project tracker
 
-    def __init__(self, tracker_path:str, verbose:bool=True) -> None:
+    The tracker file is a snapshot of all the projects. With journal=True, updates are appended
+    to a journal file next to it (one line per update) instead of rewriting the whole snapshot
+    every time. The journal is replayed on top of the snapshot when loading, and folded back
+    into it by compact or save.
+
+    Projects are also indexed by fandom, posting date and posting status (drafted, uploaded to
+    IA, uploaded to GDrive), as of their last update, cf find_projects. The index is saved in
+    an index file next to the tracker and in the journal, so that it can be loaded without
+    decoding the projects. """
+
+    index_fields = ["fandom_abr", "Posting Date", "drafted", "IA", "GDrive"]
+
+    def __init__(self, tracker_path:str, verbose:bool=True, journal:bool=False,
+        lazy:bool=False, flusher:Optional[WriteBehindFlusher]=None) -> None:
+        """ With lazy=True, the tracker file is only parsed into raw per-ID data, and each project is
+        only decoded the first time it's accessed
+        With a flusher, updates are written from its background thread (write-behind) """
         super().__init__(verbose)
         self.tracker_path = tracker_path
-        if not exists(tracker_path):
-            self.projects = {}
+        self.journal_path = tracker_path + ".journal"
+        self.index_path = tracker_path + ".index"
+        self.lock_path = tracker_path + ".lock"
+        self._journal = journal
+        self._lazy = lazy
+        # Decoded projects, and raw data of the projects not decoded yet (lazy mode)
+        self.projects, self._frozen = {}, {}
+        # Projects updated since the last write, and how many batch blocks we're in
+        self._dirty, self._batch_depth = set(), 0
+        # Updates taken by _flush and not written yet, ID -> (project as to_dict, index keys),
+        # copied on the thread that made them so that _write doesn't touch the live projects
+        self._snapshots:Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        # Write-behind: one lock for the state above, one so that writes don't overlap
+        self._flusher = flusher
+        self._state_lock, self._write_lock = RLock(), Lock()
+        # Index keys recomputed from the tracker file because the index file was stale, to save
+        # (tracker stamp, keys), cf _read_index_keys
+        self._rebuilt_index:Optional[Tuple[List[int], Dict[str, Dict[str, Any]]]] = None
+        with self._locked(exclusive=False):
+            if lazy:
+                self._frozen = self._read_frozen()
+                index_keys = self._read_index_keys()
+            else:
+                if exists(tracker_path):
+                    with open(tracker_path, "r") as file:
+                        self.projects = ProjectsTracker._decode(js_load(file), verbose)
+                for id, project, _ in self._read_journal():
+                    self.projects[id] = ProjectsTracker._restore(project, verbose)
+        if lazy: self._save_rebuilt_index()
         else:
-            with open(tracker_path, "r") as file:
-                frozen = js_load(file)
-            # self.projects = decode(frozen)
-            # https://github.com/jsonpickle/jsonpickle/issues/246#issuecomment-590015187
-            # https://github.com/jsonpickle/jsonpickle/commit/eb505c02d5721c1b67cef523c20515b559075d70
-            unpickler = Unpickler()
-            jsp_loads(frozen, context=unpickler, on_missing="warn")
-            self.projects = js_loads(frozen, object_hook=lambda x: unpickler.restore(x, reset=True))
-            for project in self.projects: pass
+            index_keys = {id: ProjectsTracker._get_index_keys(project)
+                for id, project in self.projects.items()}
+        # Secondary indexes, field -> value -> IDs, and the values for each ID
+        self._index = {field: {} for field in ProjectsTracker.index_fields}
+        self._index_keys = {}
+        for id, keys in index_keys.items():
+            self._index_project(id, keys)
+
+    @contextmanager
+    def _locked(self, exclusive:bool) -> Iterator[None]:
+        """ Advisory lock on the tracker files, so that several processes can share the tracker:
+        shared for reading, so that loads can happen at the same time, exclusive for writing
+        Not reentrant, the _read_* methods expect the caller to hold it """
+        if flock is None:
+            yield
+            return
+        with open(self.lock_path, "a") as file:
+            flock(file.fileno(), LOCK_EX if exclusive else LOCK_SH)
+            try: yield
+            finally: flock(file.fileno(), LOCK_UN)
+
+    @staticmethod
+    def _decode(frozen:str, verbose:bool=True) -> Dict[str, Project]:
+        """ Decodes the projects from the content of a tracker file """
+        flattened = js_loads(frozen)
+        if all("schema" in project for project in flattened.values()):
+            return {id: Project.from_dict(project, verbose) for id, project in flattened.items()}
+        # Saved by jsonpickle, the projects can reference each other, so they're decoded together
+        # https://github.com/jsonpickle/jsonpickle/issues/246#issuecomment-590015187
+        # https://github.com/jsonpickle/jsonpickle/commit/eb505c02d5721c1b67cef523c20515b559075d70
+        unpickler = Unpickler()
+        jsp_loads(frozen, context=unpickler, on_missing="warn")
+        legacy = js_loads(frozen, object_hook=lambda x: unpickler.restore(x, reset=True))
+        return {id: Project.from_dict(project, verbose) if "schema" in project else legacy[id]
+            for id, project in flattened.items()}
+
+    @staticmethod
+    def _restore(flattened:Dict[str, Any], verbose:bool=True) -> Project:
+        """ Decodes a project that has already been parsed from json """
+        return Project.from_dict(flattened, verbose)
+
+    def _read_journal(self) -> Iterator[Tuple[str, str, Optional[Dict[str, Any]]]]:
+        """ Yields the journaled (ID, project as parsed json, index keys) updates, in order """
+        if not exists(self.journal_path): return
+        with open(self.journal_path, "r") as file:
+            for n_line, line in enumerate(file):
+                if not line.strip(): continue
+                try: record = js_loads(line)
+                except JSONDecodeError:
+                    # Most likely a write interrupted halfway through, nothing after it
+                    self._vprint(f"Ignoring corrupted journal line {n_line+1} in {self.journal_path}")
+                    break
+                # Journals from before the schema have the project as a jsonpickle string
+                project = record["project"]
+                if isinstance(project, str): project = js_loads(project)
+                yield record["id"], project, record.get("keys")
+
+    def _read_frozen(self) -> Dict[str, Any]:
+        """ Returns the raw data of all the saved projects, journal included, without decoding """
+        frozen = {}
+        if exists(self.tracker_path):
+            with open(self.tracker_path, "r") as file:
+                frozen = js_loads(js_load(file))
+        for id, project, _ in self._read_journal():
+            frozen[id] = project
+        return frozen
+
+    @staticmethod
+    def _get_index_keys(project:Project) -> Dict[str, Any]:
+        """ Returns the values the project is indexed under, cf index_fields """
+        return ProjectsTracker._get_index_keys_from(project.project_id.fandom_abr, project.metadata)
+
+    @staticmethod
+    def _get_index_keys_from(fandom_abr:str, metadata:Dict[str, Any]) -> Dict[str, Any]:
+        """ Returns the values a project is indexed under, from its fandom and metadata """
+        def get(field:str) -> Any:
+            return metadata.get(field, ProjectMetadata.default_values[field])
+        posting_date = get("Posting Date")
+        return {
+            "fandom_abr": fandom_abr,
+            "Posting Date": posting_date if isinstance(posting_date, str) else str(posting_date),
+            "drafted": drafted_link(get("Podfic Link")),
+            "IA": not placeholder_text(get("IA Link")),
+            "GDrive": not placeholder_text(get("GDrive Link"))}
+
+    def _get_tracker_stamp(self) -> List[int]:
+        """ Returns the size and modification time of the tracker file, to check whether the
+        index file is up to date """
+        stats = stat(self.tracker_path)
+        return [stats.st_size, stats.st_mtime_ns]
+
+    def _read_index_keys(self) -> Dict[str, Dict[str, Any]]:
+        """ Returns the index keys of all the saved projects, from the index file and the journal
+        If the index file is missing or out of date, recomputes them from the tracker file, for
+        _save_rebuilt_index to save once the shared lock is released """
+        keys = {}
+        if exists(self.tracker_path):
+            keys = self._read_index_file()
+            if keys is None:
+                self._vprint("Indexing the tracker...", end=" ")
+                stamp = self._get_tracker_stamp()
+                with open(self.tracker_path, "r") as file:
+                    frozen = js_loads(js_load(file))
+                keys = {id: ProjectsTracker._get_index_keys(ProjectsTracker._restore(project))
+                    for id, project in frozen.items()}
+                self._rebuilt_index = (stamp, dict(keys))
+                self._vprint("Done!")
+        for id, project, record_keys in self._read_journal():
+            keys[id] = record_keys if record_keys is not None \
+                else ProjectsTracker._get_index_keys(ProjectsTracker._restore(project))
+        return keys
+
+    def _read_index_file(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """ Returns the index keys from the index file, None if it's missing or out of date """
+        if not exists(self.index_path): return None
+        with open(self.index_path, "r") as file:
+            index = js_load(file)
+        return index["keys"] if index["tracker"] == self._get_tracker_stamp() else None
+
+    def _save_rebuilt_index(self) -> None:
+        """ Saves the index keys recomputed by _read_index_keys, under a short exclusive lock, so
+        that the next loads don't have to decode every project again
+        Skipped if the tracker file changed since, or if another process saved the index first """
+        if self._rebuilt_index is None: return
+        stamp, keys = self._rebuilt_index
+        self._rebuilt_index = None
+        with self._locked(exclusive=True):
+            if not exists(self.tracker_path) or self._get_tracker_stamp() != stamp: return
+            if self._read_index_file() is None: self._write_index(keys)
+
+    def _write_index(self, keys:Dict[str, Dict[str, Any]]) -> None:
+        """ Saves the index keys of the projects in the tracker file """
+        atomic_write(self.index_path, js_dumps({"tracker": self._get_tracker_stamp(), "keys": keys}))
+
+    def _index_project(self, id:str, keys:Optional[Dict[str, Any]]) -> None:
+        """ Updates the indexes with the project's new keys, or removes it if None """
+        for field, value in self._index_keys.pop(id, {}).items():
+            self._index[field].get(value, set()).discard(id)
+        if keys is None: return
+        self._index_keys[id] = keys
+        for field, value in keys.items():
+            self._index[field].setdefault(value, set()).add(id)
     
     def get_project(self, id:str, update_with_local_info:bool=True) -> Project:
         """ Returns one project based on ID """
         # Double-check ID
         if not self.id_exists(id): raise TrackerError(id, f"ID {id} unknown for this tracker")
         # Load project
-        project = self.projects[id]
+        project = self._load_project(id)
         
         # If asked, update file paths in case they changed since last time
         project.files._project_id = project.project_id
@@ -86,19 +298,318 @@ class ProjectsTracker(BaseObject):
         project.files._metadata, project.project_id._metadata = project.metadata, project.metadata
         return project
     
+    def _load_project(self, id:str) -> Project:
+        """ Returns the saved project, without any of the cross-references """
+        if id in self._frozen:
+            self.projects[id] = ProjectsTracker._restore(self._frozen.pop(id), self._verbose)
+        return self.projects[id]
+
     def id_exists(self, id:str) -> bool:
         """ Returns whether the ID exists in the tracker """
-        return id in self.projects
+        return id in self.projects or id in self._frozen
+
+    def ids(self) -> List[str]:
+        """ Returns all the IDs in the tracker """
+        return list(self._index_keys)
+
+    def find_projects(self, fandom_abr:Optional[str]=None, posting_date:Optional[str]=None,
+        drafted:Optional[bool]=None, ia:Optional[bool]=None, gdrive:Optional[bool]=None
+        ) -> List[str]:
+        """ Returns the IDs of the projects matching all the given criteria, using the indexes
+        ex: find_projects(fandom_abr="HRPF", drafted=True, ia=False) """
+        criteria = ProjectsTracker._get_criteria(fandom_abr, posting_date, drafted, ia, gdrive)
+        matches = [self._index[field].get(value, set()) for field, value in criteria.items()]
+        if not matches: return sorted(self.ids())
+        matches.sort(key=len)
+        return sorted(matches[0].intersection(*matches[1:]))
+
+    @staticmethod
+    def _get_criteria(fandom_abr:Optional[str], posting_date:Optional[str],
+        drafted:Optional[bool], ia:Optional[bool], gdrive:Optional[bool]) -> Dict[str, Any]:
+        """ Returns the find_projects criteria that were given, as index field -> value """
+        criteria = zip(ProjectsTracker.index_fields, [fandom_abr, posting_date, drafted, ia, gdrive])
+        return {field: value for field, value in criteria if value is not None}
 
     def update_project(self, id:str, project:Project, overwrite:bool=True) -> None:
-        """ Saves the given project to the given ID """
+        """ Saves the given project to the given ID
+        Inside of a batch block, the write is delayed until the end of the block """
         if self.id_exists(id) and not overwrite: raise TrackerError(id, f"ID {id} already exists")
-        self.projects[id] = project
-        self.save()
+        with self._state_lock:
+            self.projects[id] = project
+            self._frozen.pop(id, None)
+            self._dirty.add(id)
+            self._index_project(id, ProjectsTracker._get_index_keys(project))
+        if not self._batch_depth: self._flush()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ Coalesces all the updates made inside the block into one single write at the end
+        If an exception is raised inside the block, nothing is written and the updated projects
+        are reverted to their saved version
+        ex: with tracker.batch(): ... """
+        # Write-behind: updates from before the block shouldn't get mixed up with the block's
+        if not self._batch_depth and self._flusher: self._flusher.flush(self.tracker_path)
+        self._batch_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._batch_depth -= 1
+            if not self._batch_depth: self._rollback()
+            raise
+        self._batch_depth -= 1
+        if not self._batch_depth: self._flush()
+
+    def _flush(self) -> None:
+        """ Copies the pending updates, then writes them, or has the flusher write them in the
+        background """
+        with self._state_lock:
+            for id in self._dirty:
+                self._snapshots[id] = (deepcopy(self.projects[id].to_dict()),
+                    dict(self._index_keys[id]))
+            self._dirty = set()
+        if self._flusher: self._flusher.mark_dirty(self.tracker_path, self._write)
+        else: self._write()
+
+    def _write(self) -> None:
+        """ Writes the copied updates, cf _flush, to the journal, or to the tracker file along
+        with the saved projects """
+        with self._write_lock:
+            with self._state_lock:
+                snapshots, self._snapshots = self._snapshots, {}
+            if not snapshots: return
+            if self._journal:
+                with self._locked(exclusive=True):
+                    self._append_to_journal(snapshots)
+                return
+            with self._locked(exclusive=True):
+                saved, saved_keys = self._read_frozen(), self._read_index_keys()
+                with self._state_lock:
+                    self._merge_saved(saved, saved_keys, set(snapshots))
+                saved.update({id: project for id, (project, _) in snapshots.items()})
+                saved_keys.update({id: keys for id, (_, keys) in snapshots.items()})
+                self._write_tracker(saved, saved_keys)
+
+    def _rollback(self) -> None:
+        """ Drops the pending updates, the projects will be loaded from the saved version again """
+        with self._locked(exclusive=False):
+            saved, saved_keys = self._read_frozen(), self._read_index_keys()
+        self._save_rebuilt_index()
+        with self._state_lock:
+            for id in self._dirty:
+                self.projects.pop(id, None)
+                if id in saved: self._frozen[id] = saved[id]
+                self._index_project(id, saved_keys.get(id))
+            self._dirty = set()
+
+    def _append_to_journal(self, updates:Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]]
+        ) -> None:
+        """ Appends the project updates, ID -> (project as to_dict, index keys), to the journal,
+        in one write """
+        records = "".join(
+            js_dumps({"id": id, "project": project, "keys": keys})+"\n"
+            for id, (project, keys) in updates.items())
+        with open(self.journal_path, "a") as file:
+            file.write(records)
+            file.flush()
+            fsync(file.fileno())
     
     def save(self) -> None:
-        """ Saves the tracker """
-        frozen = encode(self.projects, indent=4, make_refs=False)
-        with open(self.tracker_path, 'w+') as file:
-            js_dump(frozen, file)
-    
+        """ Saves the tracker, folding in the journal if there is one
+        Writes to a temporary file first so that an interrupted save can't corrupt the tracker
+        Projects that were never decoded (lazy mode) are written back as is
+        Other processes may have saved the tracker since it was loaded: the saved version is read
+        again first, and only the projects updated here since the last write replace it
+        That means parsing the whole saved tracker on every save, including every update outside
+        of batch() without journal=True: use the journal for frequent small updates
+        Writes the projects as they are now, call from the thread that updates them """
+        with self._write_lock, self._locked(exclusive=True):
+            saved, saved_keys = self._read_frozen(), self._read_index_keys()
+            with self._state_lock:
+                self._merge_saved(saved, saved_keys, set(self._snapshots))
+                projects, frozen, self._dirty = dict(self.projects), dict(self._frozen), set()
+                index_keys, self._snapshots = dict(self._index_keys), {}
+            flattened = {id: project.to_dict() for id, project in projects.items()}
+            self._write_tracker({**frozen, **flattened}, index_keys)
+
+    def _write_tracker(self, flattened:Dict[str, Any], index_keys:Dict[str, Dict[str, Any]]
+        ) -> None:
+        """ Rewrites the tracker file and the index, and empties the journal, under the exclusive
+        lock """
+        atomic_write(self.tracker_path, js_dumps(js_dumps(flattened, indent=4)))
+        self._write_index(index_keys)
+        self._rebuilt_index = None
+        if exists(self.journal_path): remove(self.journal_path)
+
+    def _merge_saved(self, saved:Dict[str, Any], saved_keys:Dict[str, Dict[str, Any]],
+        written:set) -> None:
+        """ Takes the saved version of every project that wasn't updated since the last write,
+        they may have been changed by another process
+        written: the projects updated here that are being written """
+        for id, project in saved.items():
+            if id in self._dirty or id in written or self._frozen.get(id) == project: continue
+            self.projects.pop(id, None)
+            self._frozen[id] = project
+            self._index_project(id, saved_keys.get(id))
+
+    def compact(self) -> None:
+        """ Rewrites the snapshot with all the journaled updates and empties the journal """
+        self._vprint(f"Compacting {self.tracker_path}...", end=" ")
+        self.save()
+        self._vprint("Done!")
+
+
+class ProjectsTrackerSQLite(ProjectsTracker):
+    """ A project tracker, SQLite implementation
+
+    One row per project in the Projects table (project ID and file paths, lists as json), one row
+    per metadata field in the Metadata table (values as json), both indexed by project ID. Looking
+    up or updating one project doesn't need to load the rest of them.
+    Use import_tracker to copy the projects from a json tracker. """
+
+    project_id_columns = ProjectID.fields
+    files_columns = ["folder", "metadata", "ao3_template", "dw_template", "fic",
+        "audio_compressed_formatted", "audio_compressed_unformatted", "audio_raw_formatted",
+        "audio_raw_unformatted", "cover_compressed", "cover_raw"]
+
+    def __init__(self, tracker_path:str, verbose:bool=True) -> None:
+        BaseObject.__init__(self, verbose)
+        self.tracker_path = tracker_path
+        self._dirty, self._batch_depth, self._flusher = set(), 0, None
+        self._connection = sqlite3_connect(tracker_path)
+        columns = ProjectsTrackerSQLite.project_id_columns + ProjectsTrackerSQLite.files_columns
+        with self._connection:
+            self._connection.execute(f"""CREATE TABLE IF NOT EXISTS Projects (
+                id TEXT NOT NULL,
+                {", ".join(f"{column} TEXT" for column in columns)},
+                PRIMARY KEY (id)
+                );""")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS Metadata (
+                id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (id, field),
+                FOREIGN KEY (id) REFERENCES Projects (id)
+                ) WITHOUT ROWID;""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS ProjectsByFandom ON Projects (fandom_abr);")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS MetadataByField ON Metadata (field, value);")
+
+    def _load_project(self, id:str) -> Project:
+        """ Rebuilds the project from its rows, without any of the cross-references """
+        columns = ProjectsTrackerSQLite.project_id_columns + ProjectsTrackerSQLite.files_columns
+        row = self._connection.execute(
+            f"SELECT {', '.join(columns)} FROM Projects WHERE id = ?", (id,)).fetchone()
+        row = dict(zip(columns, row))
+        for column in ProjectsTrackerSQLite.files_columns[4:]:
+            row[column] = js_loads(row[column])
+        metadata = {field: js_loads(value) for field, value in self._connection.execute(
+            "SELECT field, value FROM Metadata WHERE id = ?", (id,))}
+        return Project.from_dict({
+            "schema": Project.schema,
+            "project_id": {column: row[column] for column in ProjectsTrackerSQLite.project_id_columns},
+            "files": {
+                "folder": row["folder"],
+                "metadata": row["metadata"],
+                "templates": {"ao3": row["ao3_template"], "dw": row["dw_template"]},
+                "fic": row["fic"],
+                "audio": {
+                    "compressed": {"formatted": row["audio_compressed_formatted"],
+                        "unformatted": row["audio_compressed_unformatted"]},
+                    "raw": {"formatted": row["audio_raw_formatted"],
+                        "unformatted": row["audio_raw_unformatted"]}},
+                "cover": {"compressed": row["cover_compressed"], "raw": row["cover_raw"]}},
+            "metadata": {"save_as": row["metadata"], "data": metadata}}, self._verbose)
+
+    def id_exists(self, id:str) -> bool:
+        """ Returns whether the ID exists in the tracker """
+        return self._connection.execute(
+            "SELECT 1 FROM Projects WHERE id = ?", (id,)).fetchone() is not None
+
+    def ids(self) -> List[str]:
+        """ Returns all the IDs in the tracker """
+        return [id for id, in self._connection.execute("SELECT id FROM Projects")]
+
+    def find_projects(self, fandom_abr:Optional[str]=None, posting_date:Optional[str]=None,
+        drafted:Optional[bool]=None, ia:Optional[bool]=None, gdrive:Optional[bool]=None
+        ) -> List[str]:
+        """ Returns the IDs of the projects matching all the given criteria
+        Only reads the fandom column and the metadata fields needed for the index keys """
+        criteria = ProjectsTracker._get_criteria(fandom_abr, posting_date, drafted, ia, gdrive)
+        if fandom_abr is None: request, parameters = "SELECT id, fandom_abr FROM Projects", ()
+        else: request, parameters = \
+            "SELECT id, fandom_abr FROM Projects WHERE fandom_abr = ?", (fandom_abr,)
+        fandoms = dict(self._connection.execute(request, parameters))
+        metadata = {id: {} for id in fandoms}
+        fields = ["Posting Date", "Podfic Link", "IA Link", "GDrive Link"]
+        for id, field, value in self._connection.execute(
+            "SELECT id, field, value FROM Metadata " + \
+            f"WHERE field IN ({', '.join('?' * len(fields))})", fields):
+            if id in metadata: metadata[id][field] = js_loads(value)
+        matches = []
+        for id, project_metadata in metadata.items():
+            keys = ProjectsTracker._get_index_keys_from(fandoms[id], project_metadata)
+            if all(keys[field] == value for field, value in criteria.items()): matches.append(id)
+        return sorted(matches)
+
+    def update_project(self, id:str, project:Project, overwrite:bool=True) -> None:
+        """ Saves the given project to the given ID """
+        if self.id_exists(id) and not overwrite: raise TrackerError(id, f"ID {id} already exists")
+        self._write_project(id, project)
+        self._dirty.add(id)
+        if not self._batch_depth: self._flush()
+
+    def _flush(self) -> None:
+        """ Commits the pending updates """
+        self._connection.commit()
+        self._dirty = set()
+
+    def _rollback(self) -> None:
+        """ Drops the pending updates """
+        self._connection.rollback()
+        self._dirty = set()
+
+    def _write_project(self, id:str, project:Project) -> None:
+        """ Replaces the project rows, without committing """
+        files = project.files
+        values = [getattr(project.project_id, column)
+            for column in ProjectsTrackerSQLite.project_id_columns]
+        values += [files.folder, files.metadata, files.templates.ao3, files.templates.dw]
+        values += [js_dumps(paths) for paths in [files.fic,
+            files.audio.compressed.formatted, files.audio.compressed.unformatted,
+            files.audio.raw.formatted, files.audio.raw.unformatted,
+            files.cover.compressed, files.cover.raw]]
+        columns = ProjectsTrackerSQLite.project_id_columns + ProjectsTrackerSQLite.files_columns
+        self._connection.execute(
+            f"INSERT OR REPLACE INTO Projects (id, {', '.join(columns)}) " + \
+            f"VALUES ({', '.join('?' * (len(columns)+1))})",
+            [id] + values)
+        self._connection.execute("DELETE FROM Metadata WHERE id = ?", (id,))
+        self._connection.executemany(
+            "INSERT INTO Metadata (id, field, value) VALUES (?, ?, ?)",
+            [(id, field, js_dumps(value)) for field, value in project.metadata.data.items()])
+
+    def import_tracker(self, json_tracker_path:str, overwrite:bool=True) -> None:
+        """ Copies all the projects from a json tracker, in one transaction """
+        self._vprint(f"Importing {json_tracker_path}...", end=" ")
+        json_tracker = ProjectsTracker(json_tracker_path, verbose=self._verbose)
+        with self._connection:
+            for id, project in json_tracker.projects.items():
+                if self.id_exists(id) and not overwrite:
+                    self._vprint(f"\nSkipping {id}, already in the tracker")
+                    continue
+                self._write_project(id, project)
+        self._vprint("Done!")
+
+    def save(self) -> None:
+        """ Nothing to do, every update is committed right away """
+
+    def compact(self) -> None:
+        """ Rebuilds the database file to reclaim unused space """
+        self._vprint(f"Compacting {self.tracker_path}...", end=" ")
+        self._connection.execute("VACUUM")
+        self._vprint("Done!")
+
+    def close(self) -> None:
+        """ Closes the connection to the database """
+        self._connection.close()
@@ -1,141 +1,272 @@
-# pylint: disable=too-few-public-methods
-# -*- coding: utf-8 -*-
-""" No main, don't run TODO test main? """
-
-from os.path import join, exists
-from os import mkdir, listdir
-from sys import exit
-from typing import List, Optional
-from src.base_object import BaseObject
-from src.project_id import ProjectID
-
-
-
-
-
-class CompressedFileTracker:
-    """ Compressed and raw versions of the same file(s), ex: wav VS mp3 audio, or svg VS png cover
-    art """
-    def __init__(self, compressed:List=[], raw:List=[]) -> None:
-        self.compressed = compressed
-        self.raw = raw
-
-class FormattedFileTracker:
-    """ Formatted and unformatted versions of the same file(s), ex: mp3 file named after the
-    project abbreviation, no metadata, no cover art VS ready to be posted """
-    def __init__(self, formatted:List=[], unformatted:List=[]) -> None:
-        self.formatted = formatted
-        self.unformatted = unformatted
-
-class TemplateFileTracker:
-    """ Filled ao3 and dw template files """
-    def __init__(self, ao3:str="", dw:str="") -> None:
-        self.ao3 = ao3
-        self.dw = dw
-
-
-class FileTracker(BaseObject):
-    """ Keeps track of project files:
-    - folder
-    - metadata
-    - templates
-        - ao3
-        - dw
-        - TODO add tracker?
-    - cover
-        - compressed
-        - raw
-    - audio
-        - compressed
-            - formatted
-            - unformatted
-        - raw
-            - formatted
-            - unformatted """
-
-    # Path to the parent folder of all the project folders
-    wips_folder = "../../../Music/2.3 to post"
-    # Path to the podfic tracker file, not yet implemented
-    tracker = ""
-    # Path to the DW file for accumulating podfics to xpost all at once
-    dw_mass_xpost_file = join(wips_folder, "dw.txt")
-    # File formats
-    audio_compressed_exts = [".mp3"]
-    audio_raw_exts = [".wav", ".flac"]
-    cover_compressed_exts = [".png", ".jpg", ".jpeg"]
-    cover_raw_exts = [".svg"]
-    fic_exts = [".html"]
-
-
-    def __init__(self, project_id:ProjectID, verbose:bool=True, folder:Optional[str]=None) -> None:
-        super().__init__(verbose)
-        self._project_id = project_id
-        self.folder = self._get_folder(folder)
-
-        # Files which are always there, predictably named, etc
-        self.metadata = join(self.folder, f'{self._project_id.title_abr} metadata.yaml')
-        self.templates = TemplateFileTracker()
-        self.templates.dw = join(self.folder, f'{self._project_id.title_abr} dw.txt')
-        self.templates.ao3 = join(self.folder, f'{self._project_id.title_abr} ao3.csv')
-
-        # Empty structure, will be filled by update_file_paths
-        self.fic = []
-        self.audio = CompressedFileTracker(FormattedFileTracker(), FormattedFileTracker())
-        self.cover = CompressedFileTracker()
-        self.update_file_paths()
-
-
-    def update_file_paths(self) -> None:
-        """ Populates the known files by looking for existing files in the folder """
-
-        if not exists(self.folder):
-            raise FileNotFoundError(f"Couldn't find project folder {self.folder}")
-        
-        def get_files(contains:str="", endswith:List[str]=[""], folder:str=self.folder):
-            """ Looks for files in the given folder which name contains and ends with the
-            given strings """
-            files = [
-                join(folder, file)
-                for file in listdir(folder)
-                if contains.lower() in file.lower()
-                and any([file.endswith(end) for end in endswith])
-            ]
-            
-            return sorted(files)
-
-        self.audio.compressed.unformatted = get_files(self._project_id.title_abr, FileTracker.audio_compressed_exts)
-        self.audio.raw.unformatted = get_files(self._project_id.title_abr, FileTracker.audio_raw_exts)
-        self.audio.compressed.formatted = get_files(self._project_id.safe_title, FileTracker.audio_compressed_exts)
-        self.audio.raw.formatted = get_files(self._project_id.safe_title, FileTracker.audio_raw_exts)
-        self.cover.compressed = get_files(self._project_id.title_abr, FileTracker.cover_compressed_exts)
-        self.cover.raw = get_files(self._project_id.title_abr, FileTracker.cover_raw_exts)
-        self.fic = get_files(endswith=[".html"])
-
-        # print("title abr", self._project_id.title_abr)
-        # print("full title", self._project_id.safe_title)
-        # print("mp3 wip", self.audio.compressed.unformatted)
-        # print("mp3 final", self.audio.compressed.formatted)
-        # print("wav wip", self.audio.raw.unformatted)
-        # print("wav final", self.audio.raw.formatted)
-        # print("cover png", self.cover.compressed)
-        # print("cover svg", self.cover.raw)
-        # print("fic", self.fic)
-
-
-    def _get_folder(self, folder:Optional[str]=None) -> str:
-        """ Returns the path to the project folder, ex: "wips_folder/fandom - project"
-        Raises an error if it doesn't exit
-        WARNING gotta do the title and fandom stuff first """
-
-        folder = folder if folder else join(
-            FileTracker.wips_folder,
-            f"{self._project_id.fandom_abr.lower()} - {self._project_id.title_abr}"
-        )
-        if not exists(folder): raise FileNotFoundError(f"\nProject folder doesn't exist yet: {folder}")
-        self._vprint(f"\nFound a project folder! {folder}")
-        return folder
-        
-
-    # TODO check what is there?
-    def check(self) -> None:
-        pass
+# pylint: disable=too-few-public-methods
+# -*- coding: utf-8 -*-
+""" No main, don't run TODO test main? """
+
+from bisect import insort
+from os.path import join, exists
+from os import mkdir, scandir, stat
+from sys import exit
+from time import time_ns
+from typing import Any, Dict, List, Optional, Tuple, Union
+from src.base_object import BaseObject
+from src.project_id import ProjectID
+
+
+# Folder scans, path -> (modification time, group -> (file name, lowercase file name)), cf
+# FileTracker._scan
+_scanned_folders:Dict[str, Tuple[int, Dict[str, List[Tuple[str, str]]]]] = {}
+# Folders modified more recently than that (ns) aren't cached: the modification time isn't
+# precise enough to tell apart changes made right after the scan
+racy_delay = 2_000_000_000
+
+
+
+
+
+class CompressedFileTracker:
+    """ Compressed and raw versions of the same file(s), ex: wav VS mp3 audio, or svg VS png cover
+    art """
+    def __init__(self, compressed:List=[], raw:List=[]) -> None:
+        self.compressed = compressed
+        self.raw = raw
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the paths as a json-compatible dict, cf from_dict """
+        def get(files:Union[List, "FormattedFileTracker"]) -> Any:
+            return files.to_dict() if isinstance(files, FormattedFileTracker) else list(files)
+        return {"compressed": get(self.compressed), "raw": get(self.raw)}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any]) -> "CompressedFileTracker":
+        """ Rebuilds the tracker from to_dict's output """
+        def get(files:Any) -> Union[List, "FormattedFileTracker"]:
+            return FormattedFileTracker.from_dict(files) if isinstance(files, dict) else files
+        return cls(get(data["compressed"]), get(data["raw"]))
+
+class FormattedFileTracker:
+    """ Formatted and unformatted versions of the same file(s), ex: mp3 file named after the
+    project abbreviation, no metadata, no cover art VS ready to be posted """
+    def __init__(self, formatted:List=[], unformatted:List=[]) -> None:
+        self.formatted = formatted
+        self.unformatted = unformatted
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the paths as a json-compatible dict, cf from_dict """
+        return {"formatted": list(self.formatted), "unformatted": list(self.unformatted)}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any]) -> "FormattedFileTracker":
+        """ Rebuilds the tracker from to_dict's output """
+        return cls(data["formatted"], data["unformatted"])
+
+class TemplateFileTracker:
+    """ Filled ao3 and dw template files """
+    def __init__(self, ao3:str="", dw:str="") -> None:
+        self.ao3 = ao3
+        self.dw = dw
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the paths as a json-compatible dict, cf from_dict """
+        return {"ao3": self.ao3, "dw": self.dw}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any]) -> "TemplateFileTracker":
+        """ Rebuilds the tracker from to_dict's output """
+        return cls(data["ao3"], data["dw"])
+
+
+class FileTracker(BaseObject):
+    """ Keeps track of project files:
+    - folder
+    - metadata
+    - templates
+        - ao3
+        - dw
+        - TODO add tracker?
+    - cover
+        - compressed
+        - raw
+    - audio
+        - compressed
+            - formatted
+            - unformatted
+        - raw
+            - formatted
+            - unformatted """
+
+    # Path to the parent folder of all the project folders
+    wips_folder = "../../../Music/2.3 to post"
+    # Path to the podfic tracker file, not yet implemented
+    tracker = ""
+    # Path to the DW file for accumulating podfics to xpost all at once
+    dw_mass_xpost_file = join(wips_folder, "dw.txt")
+    # File formats
+    audio_compressed_exts = [".mp3"]
+    audio_raw_exts = [".wav", ".flac"]
+    cover_compressed_exts = [".png", ".jpg", ".jpeg"]
+    cover_raw_exts = [".svg"]
+    fic_exts = [".html"]
+    # File groups, cf _scan, and the attribute with their extensions
+    file_groups = {
+        "audio_compressed": "audio_compressed_exts",
+        "audio_raw": "audio_raw_exts",
+        "cover_compressed": "cover_compressed_exts",
+        "cover_raw": "cover_raw_exts",
+        "fic": "fic_exts"}
+
+
+    def __init__(self, project_id:ProjectID, verbose:bool=True, folder:Optional[str]=None) -> None:
+        super().__init__(verbose)
+        self._project_id = project_id
+        self.folder = self._get_folder(folder)
+
+        # Files which are always there, predictably named, etc
+        self.metadata = join(self.folder, f'{self._project_id.title_abr} metadata.yaml')
+        self.templates = TemplateFileTracker()
+        self.templates.dw = join(self.folder, f'{self._project_id.title_abr} dw.txt')
+        self.templates.ao3 = join(self.folder, f'{self._project_id.title_abr} ao3.csv')
+
+        # Empty structure, will be filled by update_file_paths
+        self.fic = []
+        self.audio = CompressedFileTracker(FormattedFileTracker(), FormattedFileTracker())
+        self.cover = CompressedFileTracker()
+        self.update_file_paths()
+
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the paths as a json-compatible dict, cf from_dict """
+        return {
+            "folder": self.folder,
+            "metadata": self.metadata,
+            "templates": self.templates.to_dict(),
+            "fic": list(self.fic),
+            "audio": self.audio.to_dict(),
+            "cover": self.cover.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any], verbose:bool=True) -> "FileTracker":
+        """ Rebuilds the tracker from to_dict's output, without looking at the folder
+        The project ID isn't part of it, cf ProjectsTracker.get_project """
+        files = cls.__new__(cls)
+        BaseObject.__init__(files, verbose)
+        files.folder, files.metadata, files.fic = data["folder"], data["metadata"], data["fic"]
+        files.templates = TemplateFileTracker.from_dict(data["templates"])
+        files.audio = CompressedFileTracker.from_dict(data["audio"])
+        files.cover = CompressedFileTracker.from_dict(data["cover"])
+        return files
+
+
+    def update_file_paths(self) -> None:
+        """ Populates the known files by looking for existing files in the folder """
+
+        if not exists(self.folder):
+            raise FileNotFoundError(f"Couldn't find project folder {self.folder}")
+        
+        scanned = FileTracker._scan(self.folder)
+
+        def get_files(group:str, contains:str="") -> List[str]:
+            """ Returns the files of the group which name contains the given string """
+            contains = contains.lower()
+            return [join(self.folder, name) for name, lower in scanned[group] if contains in lower]
+
+        title_abr, safe_title = self._project_id.title_abr, self._project_id.safe_title
+        self.audio.compressed.unformatted = get_files("audio_compressed", title_abr)
+        self.audio.raw.unformatted = get_files("audio_raw", title_abr)
+        self.audio.compressed.formatted = get_files("audio_compressed", safe_title)
+        self.audio.raw.formatted = get_files("audio_raw", safe_title)
+        self.cover.compressed = get_files("cover_compressed", title_abr)
+        self.cover.raw = get_files("cover_raw", title_abr)
+        self.fic = get_files("fic")
+
+        # print("title abr", self._project_id.title_abr)
+        # print("full title", self._project_id.safe_title)
+        # print("mp3 wip", self.audio.compressed.unformatted)
+        # print("mp3 final", self.audio.compressed.formatted)
+        # print("wav wip", self.audio.raw.unformatted)
+        # print("wav final", self.audio.raw.formatted)
+        # print("cover png", self.cover.compressed)
+        # print("cover svg", self.cover.raw)
+        # print("fic", self.fic)
+
+
+    def _find_folder(self, default:str) -> str:
+        """ Looks for the project folder in the library index, in case it was renamed, returns
+        the default folder if there isn't exactly one candidate
+        The index isn't updated here, cf cli/tracker.py scan """
+        # Imported here, the library scanner uses FileTracker
+        from src.library_scanner import LibraryScanner
+        if not exists(FileTracker.wips_folder): return default
+        scanner = LibraryScanner(verbose=False)
+        folders = [folder for folder in scanner.find_folders(self._project_id.fandom_abr,
+            self._project_id.title_abr) if exists(folder)]
+        if len(folders) != 1: return default
+        self._vprint(f"\nFound the project folder in the library index: {folders[0]}")
+        return folders[0]
+
+    @staticmethod
+    def _scan(folder:str) -> Dict[str, List[Tuple[str, str]]]:
+        """ Returns the (name, lowercase name) of the files in the folder, sorted, for each group
+        (audio_compressed, audio_raw, cover_compressed, cover_raw, fic), in one pass
+        Cached until files are added, removed or renamed in the folder """
+        mtime = stat(folder).st_mtime_ns
+        cached = _scanned_folders.get(folder)
+        if cached and cached[0] == mtime: return cached[1]
+        ext_groups = FileTracker._get_ext_groups()
+        scanned = {group: [] for group in FileTracker.file_groups}
+        with scandir(folder) as entries:
+            for entry in entries:
+                for group in FileTracker._get_groups(entry.name, ext_groups):
+                    scanned[group].append((entry.name, entry.name.lower()))
+        for files in scanned.values(): files.sort()
+        if time_ns() - mtime > racy_delay: _scanned_folders[folder] = (mtime, scanned)
+        return scanned
+
+    @staticmethod
+    def keep_scan(folder:str, name:str, before:int) -> None:
+        """ Keeps the folder's scan after the project wrote the file itself: the temporary file and
+        the rename change the folder modification time, cf write_behind.atomic_write
+        before: the folder modification time before the write, the scan is only kept if it was up
+        to date then """
+        cached = _scanned_folders.get(folder)
+        if not cached or cached[0] != before: return
+        scanned = {group: list(files) for group, files in cached[1].items()}
+        entry = (name, name.lower())
+        for group in FileTracker._get_groups(name, FileTracker._get_ext_groups()):
+            if entry not in scanned[group]: insort(scanned[group], entry)
+        _scanned_folders[folder] = (stat(folder).st_mtime_ns, scanned)
+
+    @staticmethod
+    def _get_ext_groups() -> Dict[str, List[str]]:
+        """ Returns the extension lookup table, extension -> groups
+        ex: ".mp3" -> ["audio_compressed"] """
+        ext_groups = {}
+        for group, exts_attribute in FileTracker.file_groups.items():
+            for ext in getattr(FileTracker, exts_attribute):
+                ext_groups.setdefault(ext, []).append(group)
+        return ext_groups
+
+    @staticmethod
+    def _get_groups(name:str, ext_groups:Dict[str, List[str]]) -> List[str]:
+        """ Returns the groups of the file, based on its extension (after the last dot) """
+        dot = name.rfind(".")
+        return ext_groups.get(name[dot:], []) if dot != -1 else []
+
+    def _get_folder(self, folder:Optional[str]=None) -> str:
+        """ Returns the path to the project folder, ex: "wips_folder/fandom - project"
+        Raises an error if it doesn't exit
+        WARNING gotta do the title and fandom stuff first """
+
+        if not folder:
+            folder = join(
+                FileTracker.wips_folder,
+                f"{self._project_id.fandom_abr.lower()} - {self._project_id.title_abr}"
+            )
+            if not exists(folder): folder = self._find_folder(folder)
+        if not exists(folder): raise FileNotFoundError(f"\nProject folder doesn't exist yet: {folder}")
+        self._vprint(f"\nFound a project folder! {folder}")
+        return folder
+        
+
+    # TODO check what is there?
+    def check(self) -> None:
+        pass
@@ -4,6 +4,7 @@
 """ No main, don't run TODO test main? """
 
 import re
+from typing import Any, Dict
 
 
 class ProjectID:
@@ -18,6 +19,9 @@ class ProjectID:
 
     Used by ProjectTracker """
 
+    fields = ["fandom_abr", "raw_title", "safe_title", "title_abr", "full_safe_title",
+        "full_raw_title"]
+
     def __init__(self, fandom_abr:str, raw_title:str) -> None:
         self.fandom_abr, self.raw_title = fandom_abr, raw_title
         self.safe_title = self._get_safe_title(self.raw_title)
@@ -66,3 +70,15 @@ class ProjectID:
     def get_generic_id(self) -> str:
         """ Returns the generic ID for the given data """
         return "-".join([self.fandom_abr, self.title_abr]).lower()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the details as a json-compatible dict, cf from_dict """
+        return {field: getattr(self, field) for field in ProjectID.fields}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any]) -> "ProjectID":
+        """ Rebuilds the project ID from to_dict's output, without asking about the safe title """
+        project_id = cls.__new__(cls)
+        for field in ProjectID.fields:
+            setattr(project_id, field, data[field])
+        return project_id
@@ -6,14 +6,23 @@ and templates
 """
 
 from collections import UserDict
+from contextlib import contextmanager
+from copy import deepcopy
 from datetime import date
+from functools import partial
+from os import stat
+from os.path import basename, dirname
+from time import time_ns
 import yaml
+try: from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError: from yaml import SafeLoader, SafeDumper  # libyaml not installed
 from regex import search as re_search
-from typing import List, Tuple, Any, Callable, Dict
+from typing import List, Tuple, Any, Callable, Dict, Iterator, Optional
 from src.html_extractor import HTMLExtractor
-from src.fandom_taxonomy import FandomTaxonomyCSV as FandomTaxonomy
-# from src.fandom_taxonomy import FandomTaxonomySQLite as FandomTaxonomy
+from src.fandom_taxonomy import DefaultFandomTaxonomy as FandomTaxonomy
 from src.base_object import BaseObject, DebugError
+from src.project_files_tracker import FileTracker, racy_delay
+from src.write_behind import WriteBehindFlusher, atomic_write
 
 
 class PlaceholderValue(Exception):
@@ -36,6 +45,37 @@ def placeholder_text(text:str) -> bool:
     """ Detects actual text, as opposed to placeholders """
     return text.startswith("__")
 
+# Parsed metadata files, path -> (modification time, size, data), so that loading a file that
+# hasn't changed doesn't parse it again
+_parsed_yaml:Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+
+def _read_yaml(path:str) -> Dict[str, Any]:
+    """ Returns the content of the yaml file, from the cache if it hasn't changed since """
+    stats = stat(path)
+    cached = _parsed_yaml.get(path)
+    if cached and cached[:2] == (stats.st_mtime_ns, stats.st_size): return deepcopy(cached[2])
+    with open(path, "r") as file:
+        data = yaml.load(file, Loader=SafeLoader)
+    # Not cached if modified too recently to tell apart from a later change, cf racy_delay
+    if time_ns() - stats.st_mtime_ns > racy_delay:
+        _parsed_yaml[path] = (stats.st_mtime_ns, stats.st_size, deepcopy(data))
+    else: _parsed_yaml.pop(path, None)
+    return data
+
+def _write_yaml(path:str, dumped:str) -> None:
+    """ Writes the dumped data to the yaml file, and keeps it in the cache, as it reads back (ex:
+    tuples become lists) """
+    folder_mtime = stat(dirname(path) or ".").st_mtime_ns
+    atomic_write(path, dumped)
+    FileTracker.keep_scan(dirname(path) or ".", basename(path), folder_mtime)
+    stats = stat(path)
+    _parsed_yaml[path] = (stats.st_mtime_ns, stats.st_size, yaml.load(dumped, Loader=SafeLoader))
+
+works_page = "https://archiveofourown.org/works"
+def drafted_link(link:str) -> bool:
+    """ Detects actual ao3 work links, as opposed to placeholders and the works page """
+    return link != works_page and works_page in link
+
 
 class ProjectMetadata(UserDict, BaseObject):
     """ Keeps track of all project metadata, aka, mostly ao3 metadata
@@ -45,7 +85,8 @@ class ProjectMetadata(UserDict, BaseObject):
     - Use "saved" mode to load info from saved info file
 
     afterward, use:
-    - update(category, content) to update the info from outside
+    - update_md(category, content) to update the info from outside
+    - batch() around several update_md calls, to only save once
     - TODO create templates stuff
     """
 
@@ -100,6 +141,16 @@ class ProjectMetadata(UserDict, BaseObject):
         "Credits": [("__URL", "__CREDIT")],
         "Stickers": False
     }
+    # Fields that hold (link, text) tuples, cf from_dict. Parent Works are lists, cf
+    # HTMLExtractor.extract_html_data
+    pair_fields = ["Creator/Pseud(s)", "Writers", "Add co-creators?", "Cover Artist(s)", "Credits"]
+
+    # Write-behind: if set, saves are written from the flusher's background thread
+    flusher:Optional[WriteBehindFlusher] = None
+    # Fields updated since the last save, and how many batch blocks we're in
+    # Class defaults, for objects rebuilt without __init__ (from_dict)
+    _dirty:frozenset = frozenset()
+    _batch_depth = 0
 
 
     def __init__(self, files:List[str], mode:str="from yaml", verbose:bool=True) -> None:
@@ -115,11 +166,12 @@ class ProjectMetadata(UserDict, BaseObject):
         if mode == "from html":
             # Extract metadata from fic html files
             extractor = HTMLExtractor(files.fic, verbose)
-            self.data.update(extractor.extract_html_data())
-            # Get fandom info (preferred tags, media category) from fandom taxonomy
-            self._get_fandom_info()
-            # Save the metadata
-            self._save()
+            with self.batch():
+                self.data.update(extractor.extract_html_data())
+                # Get fandom info (preferred tags, media category) from fandom taxonomy
+                self._get_fandom_info()
+                # Save all of the metadata, once
+                self._dirty = frozenset(self.data)
             # print(self["Categories"])
 
         if mode == "from yaml":
@@ -130,15 +182,38 @@ class ProjectMetadata(UserDict, BaseObject):
             # Use placeholders
             self._save()
 
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the metadata as a json-compatible dict, cf from_dict """
+        return {"save_as": self.save_as, "data": dict(self.data)}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any], verbose:bool=True) -> "ProjectMetadata":
+        """ Rebuilds the metadata from to_dict's output, without loading or saving the yaml file
+        json turns the (link, text) tuples into lists, they're turned back into tuples for the
+        pair fields only """
+        metadata = cls.__new__(cls)
+        BaseObject.__init__(metadata, verbose)
+        metadata.save_as = data["save_as"]
+        metadata.data = dict(data["data"])
+        for field in ProjectMetadata.pair_fields:
+            value = metadata.data.get(field)
+            if isinstance(value, list): metadata.data[field] = [tuple(item)
+                if isinstance(item, list) else item for item in value]
+        return metadata
+
     def load(self) -> None:
         """ Loads the data from the yaml file """
-        with open(self.save_as, 'r') as file:
-            self.data.update(yaml.safe_load(file))
+        # Write-behind: a pending save would be more recent than the file
+        if ProjectMetadata.flusher: ProjectMetadata.flusher.flush(self.save_as)
+        self.data.update(_read_yaml(self.save_as))
 
     def _save(self) -> None:
-        """ Saves the data to the yaml file """
-        with open(self.save_as, 'w') as file:
-            yaml.safe_dump(dict(self.data), file)
+        """ Saves the data to the yaml file, or has the flusher save it in the background """
+        self._dirty = frozenset()
+        # Dumped now, the flusher's thread only writes the text: the data may change meanwhile
+        write = partial(_write_yaml, self.save_as, yaml.dump(dict(self.data), Dumper=SafeDumper))
+        if ProjectMetadata.flusher: ProjectMetadata.flusher.mark_dirty(self.save_as, write)
+        else: write()
 
     def update_md(self, category:str, content:Any) -> None:
         """ Updates one of the fields and saves the to the file
@@ -146,7 +221,21 @@ class ProjectMetadata(UserDict, BaseObject):
         if category not in self: raise KeyError(
             f"{category} metadata field doesn't exist, can't set it to {content}")
         self[category] = content
-        self._save()
+        self._dirty = self._dirty | {category}
+        if not self._batch_depth: self._save()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ Coalesces all the update_md calls made inside the block into one save at the end
+        If an exception is raised inside the block, nothing is saved, the updated fields are
+        saved along with the next save
+        ex: with metadata.batch(): ... """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+        if not self._batch_depth and self._dirty: self._save()
 
     def add_posting_date(self) -> None:
         """ Saves the current date as the posting date
@@ -210,50 +299,69 @@ class ProjectMetadata(UserDict, BaseObject):
 
     def _get_fandom_info(self) -> None:
         """ Get the preferred version of the fandom tags and the media category using
-        FandomTaxonomy
+        FandomTaxonomy, shared by all the projects
         TODO rewrite FandomTaxonomy... """
-        fandom_taxonomy = FandomTaxonomy()
+        fandom_taxonomy = FandomTaxonomy.shared()
         preferred_tags, _, _, category = fandom_taxonomy.get_all_info(self["Fandoms"])
-        self.update_md("Fandoms", preferred_tags)
-        self.update_md("Media Category", category)
+        with self.batch():
+            self.update_md("Fandoms", preferred_tags)
+            self.update_md("Media Category", category)
 
 
     def check_and_format(self, posted:bool=False) -> None:
-        """ Double checks everything is ready to fill the templates """
-
-        for category in ["Summary", "Rating", "IA Link", "GDrive Link", "Summary", "Audio Length"]:
-            if category in self and not isinstance(self[category], str) and \
-                isinstance(self[category], list) and len(self[category]) < 1:
-                raise ValueError(f"Too many elements for {category}: {self[category]}")
-        
-        for category in ["Summary", "Rating", "IA Link", "IA Streaming Links", "GDrive Link",
-            "Audio Length", "Archive Warnings", "Fandoms"]:
-            if not category in self:
-                raise ValueError(f"Not enough elements for {category}: {self[category]}")
-
-        for category in ["Audio Length", "Media Category", "IA Link",
-            "GDrive Link", "IA Streaming Links"] + ["Podfic Link", "Posting Date"] if posted else []:
-            if self[category] == ProjectMetadata.default_values[category]:
-                raise PlaceholderValue(category, self[category])
-
-        domains = [
-            ("Rating", ["Not Rated", "General Audiences", "Teen And Up Audiences", "Mature","Explicit"]),
-            ("Archive Warnings", ["Choose Not To Use Archive Warnings", "Graphic Depictions Of Violence",
-                "Major Character Death", "No Archive Warnings Apply", "Rape/Non-Con", "Underage Sex"]),
-            ("Categories", ["F/F", "F/M", "Gen", "M/M", "Multi", "Other"])]
-        
-
-        for category, domain in domains:
-            if type(self[category]) == str:
-                if self[category] not in domain:
-                    raise ValueError(f"Unexpected value for {category}: {self[category]}\n"+\
-                        f"Should be in {domain}")
-            elif type(self[category]) == list:
-                for item in self[category]:
-                    if item not in domain:
-                        raise ValueError(f"Unexpected value for {category}: {item}\n"+\
-                            f"Should be in {domain}")
-            else:
-                raise ValueError(
-                    f"Unexpected type for {category}: should be str or list, is {self[category]}")
-
+        """ Double checks everything is ready to fill the templates, raises the first issue found
+        cf lint_metadata """
+        issues = lint_metadata(self.data, posted)
+        if issues: raise issues[0]
+
+
+# Fields checked by lint_metadata
+single_value_fields = ["Summary", "Rating", "IA Link", "GDrive Link", "Audio Length"]
+required_fields = ["Summary", "Rating", "IA Link", "IA Streaming Links", "GDrive Link",
+    "Audio Length", "Archive Warnings", "Fandoms"]
+placeholder_fields = ["Audio Length", "Media Category", "IA Link", "GDrive Link",
+    "IA Streaming Links"]
+posted_placeholder_fields = ["Podfic Link", "Posting Date"]
+domains = {
+    "Rating": frozenset(["Not Rated", "General Audiences", "Teen And Up Audiences", "Mature",
+        "Explicit"]),
+    "Archive Warnings": frozenset(["Choose Not To Use Archive Warnings",
+        "Graphic Depictions Of Violence", "Major Character Death", "No Archive Warnings Apply",
+        "Rape/Non-Con", "Underage Sex"]),
+    "Categories": frozenset(["F/F", "F/M", "Gen", "M/M", "Multi", "Other"])}
+
+def lint_metadata(data:Dict[str, Any], posted:bool=False, placeholders:bool=False
+    ) -> List[Exception]:
+    """ Returns all the issues in the metadata, as the exceptions check_and_format would raise,
+    ex: PlaceholderValue for the fields that still have their default value
+    With posted, the placeholder fields and Podfic Link and Posting Date have to be filled in
+    With placeholders, the placeholder fields are checked even if not posted (cli/lint.py), not
+    before drafting (check_and_format) """
+    issues = []
+    for category in single_value_fields:
+        if isinstance(data.get(category), list) and len(data[category]) < 1:
+            issues.append(ValueError(f"Too many elements for {category}: {data[category]}"))
+
+    for category in required_fields:
+        if category not in data:
+            issues.append(ValueError(f"Not enough elements for {category}: missing"))
+
+    for category in (placeholder_fields if posted or placeholders else []) \
+        + (posted_placeholder_fields if posted else []):
+        if category in data and data[category] == ProjectMetadata.default_values[category]:
+            issues.append(PlaceholderValue(category, data[category]))
+
+    for category, domain in domains.items():
+        if category not in data: continue
+        value = data[category]
+        if isinstance(value, str): unexpected = [] if value in domain else [value]
+        elif isinstance(value, list): unexpected = [item for item in value
+            if not isinstance(item, str) or item not in domain]
+        else:
+            issues.append(ValueError(
+                f"Unexpected type for {category}: should be str or list, is {value}"))
+            continue
+        if unexpected: issues.append(ValueError(
+            f"Unexpected value for {category}: {', '.join(str(item) for item in unexpected)}\n"+\
+            f"Should be in {sorted(domain)}"))
+    return issues
@@ -151,8 +151,9 @@ class Ao3Template(Template):
         if recompute is True:
             self.summary = self._get_ao3_summary()
             self.work_text = self._get_ao3_work_text()
-            self._info.update_md("Summary", self.summary)
-            self._info.update_md("Work Text", self.work_text)
+            with self._info.batch():
+                self._info.update_md("Summary", self.summary)
+                self._info.update_md("Work Text", self.work_text)
         else:
             self.summary = self._info["Summary"]
             self.work_text = self._info["Work Text"]
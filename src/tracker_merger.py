@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+""" Merging several tracker files into one, ex: old trackers from before a reinstall
+Streams the tracker files instead of loading them, so that big archives can be merged in bounded
+memory: at most one project per tracker file is parsed/decoded at a time """
+
+from json import JSONDecoder, JSONDecodeError, dumps as js_dumps, loads as js_loads
+from os.path import exists
+from re import compile as re_compile
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+from src.base_object import BaseObject
+from src.project import ProjectsTracker
+from src.write_behind import atomic_open
+
+
+# Longest run of complete characters/escape sequences inside of a json string
+string_content_regex = re_compile(r'(?:[^"\\]|\\u[0-9a-fA-F]{4}|\\[^u])*')
+# Escaped first half of a surrogate pair, the second half has to be decoded along with it
+high_surrogate_regex = re_compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}$')
+whitespace_regex = re_compile(r'[ \t\n\r]*')
+
+
+class TrackerReader:
+    """ Streams the projects of a tracker file
+
+    Tracker files are a json string (the jsonpickle encoding of the projects dict), so the file is
+    unescaped chunk by chunk, and the unescaped text is split into (ID, project) entries one at a
+    time. """
+
+    chunk_size = 1 << 16
+
+    def __init__(self, tracker_path:str) -> None:
+        if exists(tracker_path + ".journal"): raise ValueError(
+            f"{tracker_path} has pending journal updates, compact it first (cli/tracker.py compact)")
+        self.tracker_path = tracker_path
+
+    def _unescape(self, file:TextIO) -> Iterator[str]:
+        """ Yields the content of the json string in the file, unescaped, chunk by chunk """
+        buffer = file.read(TrackerReader.chunk_size).lstrip()
+        if not buffer.startswith('"'): raise ValueError(f"Not a tracker file: {self.tracker_path}")
+        buffer = buffer[1:]
+        while True:
+            end = string_content_regex.match(buffer).end()
+            closed = end < len(buffer) and buffer[end] == '"'
+            # Keep the first half of a surrogate pair for later, unless it is an escaped backslash
+            # followed by "u..."
+            found = None if closed else high_surrogate_regex.search(buffer, 0, end)
+            if found:
+                backslashes = buffer[:found.start()+1]
+                if (len(backslashes) - len(backslashes.rstrip("\\"))) % 2: end = found.start()
+            if end: yield js_loads('"' + buffer[:end] + '"')
+            if closed: return
+            buffer = buffer[end:]
+            chunk = file.read(TrackerReader.chunk_size)
+            if not chunk: raise ValueError(f"Unexpected end of tracker file: {self.tracker_path}")
+            buffer += chunk
+
+    def entries(self) -> Iterator[Tuple[str, str, Any]]:
+        """ Yields (ID, raw json text, parsed json) for each project in the tracker file """
+        decoder = JSONDecoder()
+        with open(self.tracker_path, "r") as file:
+            chunks = self._unescape(file)
+            buffer, position = "", 0
+
+            def read_more() -> bool:
+                """ Adds the next chunk to the buffer, returns False if there are none left """
+                nonlocal buffer
+                chunk = next(chunks, None)
+                if chunk is None: return False
+                buffer += chunk
+                return True
+
+            def skip_whitespace() -> None:
+                """ Moves the position to the next non-whitespace character, reading as needed """
+                nonlocal position
+                position = whitespace_regex.match(buffer, position).end()
+                while position == len(buffer) and read_more():
+                    position = whitespace_regex.match(buffer, position).end()
+                if position == len(buffer):
+                    raise ValueError(f"Unexpected end of tracker file: {self.tracker_path}")
+
+            def decode() -> Tuple[Any, int]:
+                """ Decodes the json value at the position, reading as needed """
+                while True:
+                    try: return decoder.raw_decode(buffer, position)
+                    except JSONDecodeError:
+                        if not read_more(): raise
+
+            skip_whitespace()
+            if buffer[position] != "{": raise ValueError(f"Not a tracker file: {self.tracker_path}")
+            position += 1
+            while True:
+                skip_whitespace()
+                if buffer[position] == "}": return
+                if buffer[position] == ",":
+                    position += 1
+                    skip_whitespace()
+                id, position = decode()
+                skip_whitespace()
+                position += 1  # :
+                skip_whitespace()
+                start = position
+                parsed, position = decode()
+                yield id, buffer[start:position], parsed
+                # Forget what's been read already
+                buffer, position = buffer[position:], 0
+
+
+class TrackerMerger(BaseObject):
+    """ Merges several tracker files into one
+
+    When several trackers have the same ID, the policy decides which one is kept:
+    - first: the first tracker in the list
+    - last: the last tracker in the list
+    - newest: the most recent posting date (not posted counts as oldest), then the last tracker
+    The merged tracker has the kept projects in tracker order, then in file order. """
+
+    policies = ["first", "last", "newest"]
+
+    def __init__(self, tracker_paths:List[str], policy:str="last", verbose:bool=True) -> None:
+        super().__init__(verbose)
+        if policy not in TrackerMerger.policies: raise ValueError(
+            f"TrackerMerger policy must be one of {TrackerMerger.policies}, got {policy}")
+        self._readers = [TrackerReader(path) for path in tracker_paths]
+        self._policy = policy
+
+    @staticmethod
+    def _get_posting_date(parsed:Any) -> Tuple[str, str, str]:
+        """ Returns the project's posting date as a sortable (year, month, day) tuple, empty if not
+        posted
+        Only projects saved before the schema are decoded, cf Project.from_dict """
+        if "schema" in parsed: date = parsed["metadata"]["data"].get("Posting Date", "")
+        else: date = ProjectsTracker._restore(parsed).metadata.get("Posting Date", "")
+        if not isinstance(date, str) or len(date.split("-")) != 3: return ("", "", "")
+        day, month, year = date.split("-")
+        return (year, month, day)
+
+    def _pick_sources(self) -> Dict[str, int]:
+        """ Returns, for each ID, the index of the tracker the project will be taken from """
+        sources, posting_dates = {}, {}
+        for i_source, reader in enumerate(self._readers):
+            for id, _, parsed in reader.entries():
+                if id in sources: self._vprint(f"Conflict for {id} in {reader.tracker_path}")
+                if self._policy == "first":
+                    keep = id not in sources
+                elif self._policy == "last":
+                    keep = True
+                else:
+                    posting_date = TrackerMerger._get_posting_date(parsed)
+                    keep = id not in sources or posting_date >= posting_dates[id]
+                    if keep: posting_dates[id] = posting_date
+                if keep: sources[id] = i_source
+        return sources
+
+    def merge(self, output_path:str) -> None:
+        """ Writes the merged tracker to output_path, through a temporary file """
+        self._vprint(f"Merging {len(self._readers)} trackers into {output_path}...")
+        sources = self._pick_sources()
+        written = set()
+        with atomic_open(output_path) as file:
+            file.write('"{')
+            for i_source, reader in enumerate(self._readers):
+                for id, raw, _ in reader.entries():
+                    if sources[id] != i_source or id in written: continue
+                    entry = ("," if written else "") + "\n    " + js_dumps(id) + ": " + raw
+                    # Escaped so that it fits inside of the json string
+                    file.write(js_dumps(entry)[1:-1])
+                    written.add(id)
+            file.write(js_dumps("\n}")[1:-1] + '"')
+        self._vprint(f"Done! {len(written)} projects")
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+""" Tracker statistics: totals, per fandom and per month aggregates, words per minute
+The fields are extracted from the projects once, into columns, and everything after that is
+vectorized with numpy """
+
+from re import compile as re_compile
+from typing import Any, Dict, List, Optional
+import numpy as np
+from src.base_object import BaseObject
+from src.project import ProjectsTracker
+
+
+audio_length_regex = re_compile("^(?P<hours>[0-9]+):(?P<minutes>[0-9]{2}):(?P<seconds>[0-9]{2})")
+posting_date_regex = re_compile("^(?P<day>[0-9]{2})-(?P<month>[0-9]{2})-(?P<year>[0-9]{4})$")
+
+
+def parse_audio_length(length:Any) -> float:
+    """ "1:02:03" -> 3723., NaN if it's a placeholder or otherwise unknown """
+    found = audio_length_regex.search(length) if isinstance(length, str) else None
+    if not found: return np.nan
+    return int(found.group("hours"))*3600 + int(found.group("minutes"))*60 \
+        + int(found.group("seconds"))
+
+def parse_wordcount(wordcount:Any) -> float:
+    """ 1234, "1234" or "1,234" -> 1234., NaN if it's a placeholder or otherwise unknown """
+    if isinstance(wordcount, str): wordcount = wordcount.replace(",", "")
+    try: return float(wordcount)
+    except (TypeError, ValueError): return np.nan
+
+def parse_posting_month(posting_date:Any) -> str:
+    """ "25-12-2023" -> "2023-12", "" if it's a placeholder or otherwise unknown """
+    found = posting_date_regex.search(posting_date) if isinstance(posting_date, str) else None
+    if not found: return ""
+    return f"{found.group('year')}-{found.group('month')}"
+
+
+class TrackerStats(BaseObject):
+    """ Statistics over all the projects in a tracker
+
+    Columns, one row per project:
+    - ids, fandoms (abbreviations), ratings
+    - months, posting month as yyyy-mm, "" if not posted
+    - seconds, audio length, NaN if unknown
+    - words, wordcount, NaN if unknown
+
+    Then use totals, per_fandom, per_month, per_rating, words_per_minute, or report for all of it """
+
+    wpm_percentiles = [10, 25, 50, 75, 90]
+    wpm_bins = [0, 100, 120, 140, 160, 180, 200, np.inf]
+
+    def __init__(self, tracker:ProjectsTracker, verbose:bool=True) -> None:
+        super().__init__(verbose)
+        self._vprint("Extracting tracker stats...", end=" ")
+        ids, fandoms, ratings, months, seconds, words = [], [], [], [], [], []
+        for id in tracker.ids():
+            project = tracker.get_project(id, update_with_local_info=False)
+            metadata = project.metadata
+            ids.append(id)
+            fandoms.append(project.project_id.fandom_abr)
+            ratings.append(str(metadata.get("Rating", "")))
+            months.append(parse_posting_month(metadata.get("Posting Date")))
+            seconds.append(parse_audio_length(metadata.get("Audio Length")))
+            words.append(parse_wordcount(metadata.get("Wordcount")))
+        self.ids = np.array(ids, dtype=str)
+        self.fandoms = np.array(fandoms, dtype=str)
+        self.ratings = np.array(ratings, dtype=str)
+        self.months = np.array(months, dtype=str)
+        self.seconds = np.array(seconds, dtype=float)
+        self.words = np.array(words, dtype=float)
+        self._vprint("Done!")
+
+    def totals(self) -> Dict[str, float]:
+        """ Number of projects (all, posted), total audio length (hours), total wordcount """
+        return {
+            "projects": len(self.ids),
+            "posted": int(np.count_nonzero(self.months != "")),
+            "hours": float(np.nansum(self.seconds)) / 3600,
+            "words": int(np.nansum(self.words))}
+
+    def _aggregate(self, labels:np.ndarray, selected:Optional[np.ndarray]=None
+        ) -> Dict[str, Dict[str, float]]:
+        """ Number of projects, audio length (hours) and wordcount for each label, optionally only
+        over the selected projects (boolean mask) """
+        seconds, words = np.nan_to_num(self.seconds), np.nan_to_num(self.words)
+        if selected is not None:
+            labels, seconds, words = labels[selected], seconds[selected], words[selected]
+        keys, codes = np.unique(labels, return_inverse=True)
+        counts = np.bincount(codes, minlength=len(keys))
+        seconds = np.bincount(codes, weights=seconds, minlength=len(keys))
+        words = np.bincount(codes, weights=words, minlength=len(keys))
+        return {str(key): {"projects": int(count), "hours": float(second)/3600, "words": int(word)}
+            for key, count, second, word in zip(keys, counts, seconds, words)}
+
+    def per_fandom(self) -> Dict[str, Dict[str, float]]:
+        """ Number of projects, audio length (hours) and wordcount for each fandom """
+        return self._aggregate(self.fandoms)
+
+    def per_month(self) -> Dict[str, Dict[str, float]]:
+        """ Number of projects, audio length (hours) and wordcount for each posting month, only
+        for posted projects """
+        return self._aggregate(self.months, selected=self.months != "")
+
+    def per_rating(self) -> Dict[str, int]:
+        """ Number of projects for each rating """
+        keys, counts = np.unique(self.ratings, return_counts=True)
+        return {str(key): int(count) for key, count in zip(keys, counts)}
+
+    def words_per_minute(self) -> Dict[str, Any]:
+        """ Words per minute distribution, over the projects with both wordcount and audio length:
+        mean, percentiles and histogram (number of projects in each of the wpm_bins ranges) """
+        known = ~np.isnan(self.seconds) & ~np.isnan(self.words) & (self.seconds > 0)
+        wpm = self.words[known] / (self.seconds[known] / 60)
+        if not len(wpm): return {"projects": 0}
+        histogram, _ = np.histogram(wpm, bins=TrackerStats.wpm_bins)
+        return {
+            "projects": len(wpm),
+            "mean": float(wpm.mean()),
+            "percentiles": dict(zip(TrackerStats.wpm_percentiles,
+                np.percentile(wpm, TrackerStats.wpm_percentiles).tolist())),
+            "histogram": {f"{low}-{high}": int(count) for low, high, count
+                in zip(TrackerStats.wpm_bins[:-1], TrackerStats.wpm_bins[1:], histogram)}}
+
+    def report(self) -> str:
+        """ All the stats, formatted for printing """
+
+        def table(title:str, rows:Dict[str, Dict[str, float]]) -> List[str]:
+            lines = [f"\n{title}", f"{'':<30}{'projects':>10}{'hours':>10}{'words':>12}"]
+            lines += [f"{key:<30}{row['projects']:>10}{row['hours']:>10.1f}{row['words']:>12}"
+                for key, row in rows.items()]
+            return lines
+
+        totals = self.totals()
+        lines = [
+            f"Projects: {totals['projects']} ({totals['posted']} posted)",
+            f"Audio: {totals['hours']:.1f} hours",
+            f"Words: {totals['words']}"]
+        lines += table("Per fandom", self.per_fandom())
+        lines += table("Per month", self.per_month())
+        lines += ["\nPer rating"] + [f"{rating:<30}{count:>10}"
+            for rating, count in self.per_rating().items()]
+        wpm = self.words_per_minute()
+        lines.append(f"\nWords per minute ({wpm['projects']} projects)")
+        if wpm["projects"]:
+            lines.append(f"mean {wpm['mean']:.0f}, " + ", ".join(f"p{percentile} {value:.0f}"
+                for percentile, value in wpm["percentiles"].items()))
+            lines += [f"{bin:<30}{count:>10}" for bin, count in wpm["histogram"].items()]
+        return "\n".join(lines)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+""" Write-behind: saving files from a background thread, so that the posting steps don't have to
+wait on serialization and disk writes """
+
+from atexit import register as atexit_register
+from contextlib import contextmanager
+from os import fsync, getpid, remove, replace
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterator, Optional, TextIO
+from src.base_object import BaseObject
+
+
+@contextmanager
+def atomic_open(path:str, encoding:str="utf-8") -> Iterator[TextIO]:
+    """ Opens a temporary file to write to, and renames it to path once done, so that an
+    interrupted write can't leave a half-written file behind. The temporary file is removed if
+    the write fails
+    The temporary file is per process, so that two processes writing the same file don't mix """
+    temp_path = f"{path}.{getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding=encoding) as file:
+            yield file
+            file.flush()
+            fsync(file.fileno())
+    except BaseException:
+        try: remove(temp_path)
+        except FileNotFoundError: pass
+        raise
+    replace(temp_path, path)
+
+def atomic_write(path:str, content:str, encoding:str="utf-8") -> None:
+    """ Writes the content in one go, cf atomic_open """
+    with atomic_open(path, encoding) as file:
+        file.write(content)
+
+
+class WriteBehindFlusher(BaseObject):
+    """ Calls the pending write functions from a background thread, every interval seconds and at
+    exit
+
+    Write functions are registered with mark_dirty under a key, ex: the path of the file they
+    write. Only the latest function is kept for each key, so several updates in a row only get
+    written once. """
+
+    def __init__(self, interval:float=2., verbose:bool=True) -> None:
+        super().__init__(verbose)
+        self.interval = interval
+        self._pending:Dict[str, Callable[[], None]] = {}
+        # One lock for the pending dict, one so that write functions are never run concurrently
+        self._pending_lock, self._write_lock = Lock(), Lock()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit_register(self.close)
+
+    def mark_dirty(self, key:str, write:Callable[[], None]) -> None:
+        """ Schedules the write function for the next flush """
+        with self._pending_lock:
+            self._pending[key] = write
+
+    def flush(self, key:Optional[str]=None) -> None:
+        """ Runs the pending write functions now, all of them or only the given key's """
+        with self._write_lock:
+            with self._pending_lock:
+                if key is None: pending, self._pending = self._pending, {}
+                elif key in self._pending: pending = {key: self._pending.pop(key)}
+                else: pending = {}
+            for key, write in pending.items():
+                try: write()
+                except Exception as e:
+                    print(f"WARNING write-behind failed for {key}, will try again: {e}")
+                    with self._pending_lock: self._pending.setdefault(key, write)
+
+    def _run(self) -> None:
+        """ Background thread loop """
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self) -> None:
+        """ Stops the background thread and writes whatever is left """
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+        self.flush()
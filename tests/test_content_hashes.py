@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+""" ContentHashStore: which steps have to be done again after a file changed """
+
+from os.path import join
+from src.content_hashes import ContentHashStore
+
+
+in_place_steps = ["audio tags", "cover art"]  # cf AudioHandler.in_place_steps
+
+
+def test_retagging_keeps_in_place_steps_and_redoes_uploads(tmp_path):
+    path = join(tmp_path, "podfic.mp3")
+    with open(path, "wb") as file:
+        file.write(b"audio")
+    hashes = ContentHashStore(store_path=join(tmp_path, "hashes.json"), verbose=False)
+    hashes.mark_done("cover art", [path], "cover hash", in_place_steps)
+    hashes.mark_done("gdrive upload", [path], "folder id")
+    hashes.mark_done("ia upload", [path], "identifier")
+
+    # Re-tagged, ex: after a title change, cf AudioHandler.update_metadata
+    assert hashes.changed_since("audio tags", [path], "new title") == [path]
+    with open(path, "wb") as file:
+        file.write(b"audio with new tags")
+    hashes.mark_done("audio tags", [path], "new title", in_place_steps)
+
+    assert hashes.changed_since("audio tags", [path], "new title") == []
+    assert hashes.changed_since("cover art", [path], "cover hash") == []
+    assert hashes.changed_since("gdrive upload", [path], "folder id") == [path]
+    assert hashes.changed_since("ia upload", [path], "identifier") == [path]
+
+
+def test_unchanged_file_isnt_done_again(tmp_path):
+    path = join(tmp_path, "podfic.mp3")
+    with open(path, "wb") as file:
+        file.write(b"audio")
+    store_path = join(tmp_path, "hashes.json")
+    ContentHashStore(store_path=store_path, verbose=False).mark_done("ia upload", [path], "id")
+
+    hashes = ContentHashStore(store_path=store_path, verbose=False)
+    assert hashes.changed_since("ia upload", [path], "id") == []
+    assert hashes.changed_since("ia upload", [path], "other id") == [path]